@@ -0,0 +1 @@
+celery --app=tow.celery:app beat --loglevel=INFO
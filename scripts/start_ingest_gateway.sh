@@ -0,0 +1 @@
+uvicorn tow.asgi_ingest:application --port 8001 --loop uvloop --http httptools --no-access-log
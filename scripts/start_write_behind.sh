@@ -0,0 +1 @@
+python manage.py run_write_behind
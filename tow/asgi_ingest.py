@@ -0,0 +1,17 @@
+"""
+ASGI config of the ingestion gateway of tow project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+It serves only the resource data writes, see wot_app.gateway.
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tow.settings")
+django.setup()
+
+from wot_app.gateway import IngestGateway  # noqa: E402
+
+application = IngestGateway()
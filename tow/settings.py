@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
 
+from celery.schedules import crontab
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
@@ -43,6 +45,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'wot_app.middleware.ProfilingMiddleware',
+    'wot_app.middleware.ApiGZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,6 +94,21 @@ DATABASES = {
     }
 }
 
+# Cache
+# Shared by all web and worker processes, e.g. for the latest state of the
+# resources, so a per-process cache such as LocMemCache only suits the tests.
+# Redis is required anyway, see Requirements in the README.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'wot_app.profiling.ProfiledRedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    }
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
@@ -114,6 +133,79 @@ STATICFILES_DIRS = (
 
 # OAUTH
 OAUTH2_PROVIDER_APPLICATION_MODEL='wot_app.Application'
+OAUTH2_PROVIDER = {
+    'OAUTH2_VALIDATOR_CLASS': 'wot_app.oauth2_validators.CachedOAuth2Validator',
+}
+WOT_LOOKUP_CACHE_TIMEOUT = 300      # seconds access tokens, applications and resources are cached
 
 # CELERY SETTINGS
 BROKER_URL = 'redis://localhost:6379/0'
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERYBEAT_SCHEDULE = {
+    'rollup-resource-data': {
+        'task': 'wot_app.tasks.task_rollup_resource_data',
+        'schedule': crontab(minute=15),
+    },
+}
+
+# RESOURCE DATA RETENTION SETTINGS
+# Retention is set per resource or per application, in days; resource data
+# older than that is rolled up into hourly and daily aggregates.
+WOT_ROLLUP_BATCH_SIZE = 5000        # samples rolled up and deleted per transaction
+WOT_ROLLUP_MAX_BATCHES = 100        # batches per resource per run
+
+# RESOURCE HISTORY SETTINGS
+WOT_HISTORY_MAX_BUCKETS = 10000     # buckets a downsampled history query may span
+
+# RESOURCE STREAM SETTINGS
+# Stream clients of a process share one Redis subscription. Serve the API with
+# an evented worker (e.g. gunicorn -k gevent) to hold many idle streams.
+WOT_REDIS_URL = 'redis://localhost:6379/2'
+
+# WEBHOOK DELIVERY SETTINGS
+WOT_WEBHOOK_MAX_WORKERS = 20        # concurrent deliveries per worker process
+WOT_WEBHOOK_POOL_SIZE = 10          # keep-alive connections per host
+WOT_WEBHOOK_TIMEOUT = (3.05, 10)    # connect and read timeouts in seconds
+WOT_WEBHOOK_RATE_LIMIT = None       # requests per second per host, None for no limit
+WOT_WEBHOOK_RATE_BURST = 1
+WOT_WEBHOOK_BATCH_SIZE = 100        # notifications per batch of subscriptions that do not set one
+WOT_WEBHOOK_MAX_ATTEMPTS = 6        # deliveries of a notification before it is stored as undelivered
+WOT_WEBHOOK_RETRY_DELAY = 5         # seconds before the first retry, doubled for every next one
+WOT_WEBHOOK_RETRY_MAX_DELAY = 600
+WOT_WEBHOOK_BREAKER_THRESHOLD = 5   # consecutive failures that stop deliveries to a host
+WOT_WEBHOOK_BREAKER_COOLDOWN = 30   # seconds before deliveries to that host are tried again
+
+# METRICS SETTINGS
+WOT_METRICS_FLUSH_INTERVAL = 5      # seconds metrics are collected in a process before being reported
+WOT_METRICS_CELERY_QUEUES = ('celery',)  # broker queues whose depth is reported
+WOT_METRICS_MAX_HOSTS = 100         # webhook hosts reported separately, the rest as "other"
+WOT_METRICS_ALLOWED_NETWORKS = ('127.0.0.1/32', '::1/128')  # clients that may read /metrics
+
+# API SETTINGS
+WOT_MAX_DECOMPRESSED_BODY = 10485760  # bytes a gzipped request body may inflate to
+
+# PROFILING SETTINGS
+# When enabled, API responses carry a Server-Timing header with their SQL,
+# cache and serialization time, see wot_app.middleware.ProfilingMiddleware.
+WOT_PROFILING = False
+WOT_PROFILING_SAMPLE_RATE = 0.01    # fraction of the API requests dumped with cProfile
+WOT_PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# INGESTION GATEWAY SETTINGS
+# The asynchronous gateway (tow/asgi_ingest.py) serves resource data writes
+# and inserts the samples of concurrent requests together.
+WOT_GATEWAY_MAX_BATCH = 1000        # samples per insert
+WOT_GATEWAY_MAX_DELAY = 0.02        # seconds a sample waits for its batch to fill up
+WOT_GATEWAY_WRITERS = 2             # concurrent inserts
+WOT_GATEWAY_MEMO_TIMEOUT = 5        # seconds tokens, applications and resources are kept in the process
+WOT_GATEWAY_MAX_BODY = 1048576      # bytes
+
+# WRITE-BEHIND SETTINGS
+# When enabled, resource data writes are answered with 202 once queued on the
+# local disk and inserted by the run_write_behind command, see wot_app.writebehind.
+WOT_WRITE_BEHIND = False
+WOT_WRITE_BEHIND_QUEUE = os.path.join(BASE_DIR, 'write-behind.sqlite3')
+WOT_WRITE_BEHIND_MAX_BATCH = 5000   # samples per group commit
+WOT_WRITE_BEHIND_MAX_DELAY = 1.0    # seconds a queued sample waits for its group commit
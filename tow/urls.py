@@ -3,7 +3,7 @@ from django.contrib import admin
 from wot_app.api.urls import urlpatterns as wot_api_urls
 from wot_app.urls import urlpatterns as wot_ui_urls
 
-from wot_app.api.views import notification_endpoint
+from wot_app.api.views import notification_endpoint, metrics_endpoint
 
 urlpatterns = [
     url(r'^admin/', include(admin.site.urls)),
@@ -12,5 +12,6 @@ urlpatterns = [
     url(r'^accounts/logout/$', 'django.contrib.auth.views.logout'),
     url(r'^api/', include(wot_api_urls)),
     url(r'^hook', notification_endpoint),
+    url(r'^metrics$', metrics_endpoint),
     url(r'^', include(wot_ui_urls)),
 ]
@@ -0,0 +1,183 @@
+"""
+Media types of the API bodies.
+
+Request bodies are decompressed by their Content-Encoding, gzip or identity,
+and decoded by their Content-Type: MessagePack and CBOR are decoded as such,
+anything else is read as JSON as it always was. Responses are encoded in the
+type the Accept header prefers among JSON, MessagePack and CBOR, JSON by
+default; their compression is left to ApiGZipMiddleware.
+
+MessagePack and CBOR need the msgpack and cbor2 packages. Without them, bodies
+in those types are rejected as unsupported and responses fall back to JSON.
+"""
+import json
+import zlib
+from datetime import timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from wot_app.api.renderers import JSON_CONTENT_TYPE, json_dumps
+from wot_app.profiling import serialization_timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+CBOR_CONTENT_TYPE = 'application/cbor'
+
+_MEDIA_TYPE_ALIASES = {
+    'application/x-msgpack': MSGPACK_CONTENT_TYPE,
+    'application/vnd.msgpack': MSGPACK_CONTENT_TYPE,
+}
+
+
+class UnsupportedMediaType(Exception):
+    pass
+
+
+class RequestBodyTooLarge(Exception):
+    pass
+
+
+def _media_type(value):
+    media_type = value.split(';', 1)[0].strip().lower()
+    return _MEDIA_TYPE_ALIASES.get(media_type, media_type)
+
+
+_json_encoder = DjangoJSONEncoder()
+
+
+def _encode_default(obj):
+    # Datetimes, decimals and UUIDs as in the JSON responses
+    return _json_encoder.default(obj)
+
+
+def _decode_json(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body.decode('utf-8'))
+
+
+def _decode_msgpack(body):
+    try:
+        return msgpack.unpackb(body, raw=False)
+    except msgpack.UnpackException as e:
+        raise ValueError('Improperly formatted MessagePack body') from e
+
+
+def _decode_cbor(body):
+    return cbor2.loads(body)
+
+
+def _encode_msgpack(obj):
+    with serialization_timer():
+        return msgpack.packb(obj, default=_encode_default, use_bin_type=True)
+
+
+def _encode_cbor_default(encoder, obj):
+    encoder.encode(_encode_default(obj))
+
+
+def _encode_cbor(obj):
+    with serialization_timer():
+        return cbor2.dumps(obj, timezone=timezone.utc, default=_encode_cbor_default)
+
+
+def _codecs():
+    """
+    Returns the (decode, encode) pairs of the media types whose packages are
+    installed.
+    """
+    codecs = {JSON_CONTENT_TYPE: (_decode_json, json_dumps)}
+    if msgpack is not None:
+        codecs[MSGPACK_CONTENT_TYPE] = (_decode_msgpack, _encode_msgpack)
+    if cbor2 is not None:
+        codecs[CBOR_CONTENT_TYPE] = (_decode_cbor, _encode_cbor)
+    return codecs
+
+
+CODECS = _codecs()
+
+
+def decompress(body, content_encoding=None, max_size=None):
+    """
+    Decompresses a request body by its Content-Encoding. Raises
+    RequestBodyTooLarge rather than inflating more than max_size bytes.
+    """
+    content_encoding = (content_encoding or 'identity').strip().lower()
+    if content_encoding == 'identity':
+        return body
+    if content_encoding not in ('gzip', 'x-gzip'):
+        raise UnsupportedMediaType('Unsupported content encoding {}'.format(content_encoding))
+
+    if max_size is None:
+        max_size = getattr(settings, 'WOT_MAX_DECOMPRESSED_BODY', 10 * 1024 * 1024)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, max_size + 1)
+    except zlib.error as e:
+        raise ValueError('Improperly compressed body') from e
+    if len(data) > max_size:
+        raise RequestBodyTooLarge()
+    if not decompressor.eof:
+        raise ValueError('Truncated compressed body')
+    return data
+
+
+def decode_body(body, content_type=None, content_encoding=None):
+    """
+    Returns the data of a request body. Raises ValueError if the body is not
+    well-formed, UnsupportedMediaType if it cannot be decoded here.
+    """
+    media_type = _media_type(content_type or JSON_CONTENT_TYPE)
+    if media_type in (MSGPACK_CONTENT_TYPE, CBOR_CONTENT_TYPE) and media_type not in CODECS:
+        raise UnsupportedMediaType('Unsupported content type {}'.format(media_type))
+
+    body = decompress(body, content_encoding)
+    if not body:
+        raise ValueError('Empty body')
+    decode, _ = CODECS.get(media_type, CODECS[JSON_CONTENT_TYPE])
+    return decode(body)
+
+
+def negotiate(accept):
+    """
+    Returns the media type of the response to a request with the given Accept
+    header: the supported type with the highest quality, the earliest on a tie.
+    """
+    best, best_quality = JSON_CONTENT_TYPE, 0.0
+    for media_range in (accept or '').split(','):
+        media_type, *params = media_range.split(';')
+        media_type = _media_type(media_type)
+        if media_type not in CODECS:
+            continue
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+def encode_body(obj, media_type):
+    _, encode = CODECS[media_type]
+    return encode(obj)
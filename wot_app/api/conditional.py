@@ -0,0 +1,65 @@
+import hashlib
+from calendar import timegm
+
+from django.http.response import HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+from wot_app.api.codecs import negotiate
+from wot_app.api.renderers import JSON_CONTENT_TYPE
+from wot_app.caching import get_stamp
+
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def stamp_validators(key, request, *parents):
+    """
+    Returns the ETag and Last-Modified time of a listing from the stamp of its
+    objects, the query string and the modification times of its parents.
+    """
+    token, modified = get_stamp(key)
+    etag = make_etag(token, request.GET.urlencode(), *(parent.modified for parent in parents))
+    return etag, max([modified] + [parent.modified for parent in parents])
+
+
+def object_validators(obj):
+    return make_etag(obj._meta.model_name, obj.pk, obj.modified), obj.modified
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        # ApiGZipMiddleware marks the ETags of compressed responses
+        etags = [tag[:-len(';gzip')] if tag.endswith(';gzip') else tag for tag in parse_etags(if_none_match)]
+        return etag is not None and (etag in etags or '*' in etags)
+
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None and last_modified is not None:
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and int(timegm(last_modified.utctimetuple())) <= if_modified_since
+
+    return False
+
+
+def conditional_response(request, etag, last_modified, render):
+    """
+    Answers a conditional GET with 304 if the client's copy is still current;
+    calls render for the full response otherwise.
+    """
+    media_type = negotiate(request.META.get('HTTP_ACCEPT'))
+    if etag is not None and media_type != JSON_CONTENT_TYPE:
+        # Every representation has its own ETag
+        etag = make_etag(etag, media_type)
+
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        response = render()
+
+    if response.status_code in (200, 304):
+        if etag is not None:
+            response['ETag'] = quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+    return response
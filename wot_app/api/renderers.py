@@ -0,0 +1,80 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http.response import StreamingHttpResponse
+
+from wot_app.profiling import serialization_timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_CONTENT_TYPE = 'application/json'
+
+_json_encoder = DjangoJSONEncoder()
+
+
+def json_dumps(obj):
+    """
+    Encodes obj as JSON bytes, with orjson if it is installed. Datetimes and
+    the types orjson does not know are left to DjangoJSONEncoder, so that the
+    output is the same either way.
+    """
+    with serialization_timer():
+        if orjson is not None:
+            return orjson.dumps(obj, default=_json_encoder.default,
+                                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def iterate_in_chunks(queryset, chunk_size=500):
+    """
+    Iterates over the queryset in id order, fetching chunk_size rows at a time
+    with keyset pagination so that memory use stays bounded.
+    """
+    last_id = None
+    while True:
+        chunk = queryset.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+
+        yield from chunk
+        last_id = chunk[-1].id
+
+
+def _json_array_chunks(items):
+    yield b'['
+    first = True
+    for item in items:
+        if not first:
+            yield b','
+        first = False
+        yield json_dumps(item)
+    yield b']'
+
+
+def stream_json_array(items):
+    """
+    Streams the items as a JSON array, encoding one item at a time.
+    """
+    return StreamingHttpResponse(_json_array_chunks(items), content_type=JSON_CONTENT_TYPE)
+
+
+def paginate_queryset(queryset, cursor=None, limit=100):
+    """
+    Returns a page of the queryset in id order and the cursor of the next
+    page, which is the id of the last object of the page, if there are more.
+    """
+    queryset = queryset.order_by('id')
+    if cursor is not None:
+        queryset = queryset.filter(id__gt=int(cursor))
+
+    page = list(queryset[:limit + 1])
+    if len(page) > limit:
+        page = page[:limit]
+        return page, str(page[-1].id)
+    return page, None
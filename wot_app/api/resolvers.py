@@ -0,0 +1,45 @@
+from django.http.response import Http404
+
+from wot_app.lookups import get_resource
+from wot_app.models import Resource, Event, EventSubscription
+
+
+def resolve_api_objects(application, res_slug=None, ev_slug=None, subs_id=None):
+    """
+    Resolves the resource, event and subscription of a nested API URL with a
+    single joined query on the deepest object, checking that every object
+    belongs to its parent. Resources alone, as in device reads and writes, are
+    served from the lookup cache. Raises Http404 if the chain does not exist.
+    """
+    resource = event = subscription = None
+    try:
+        if subs_id is not None:
+            subscription = EventSubscription.objects.select_related('event', 'event__resource').get(
+                id=subs_id,
+                event__slug=ev_slug,
+                event__application=application,
+                event__resource__slug=res_slug,
+                event__resource__application=application)
+            event = subscription.event
+            resource = event.resource
+        elif ev_slug is not None:
+            event = Event.objects.select_related('resource').get(
+                slug=ev_slug,
+                application=application,
+                resource__slug=res_slug,
+                resource__application=application)
+            resource = event.resource
+        elif res_slug is not None:
+            resource = get_resource(application, res_slug)
+            if resource is None:
+                raise Resource.DoesNotExist
+    except (Resource.DoesNotExist, Event.DoesNotExist, EventSubscription.DoesNotExist):
+        raise Http404('No such API object')
+
+    # Parents are known already; spare their lazy lookups
+    if resource is not None:
+        resource.application = application
+    if event is not None:
+        event.application = application
+
+    return resource, event, subscription
@@ -0,0 +1,132 @@
+"""
+Serializers of the API listings.
+
+They take the already known parent objects as arguments and fetch related
+objects in bulk, so that a listing costs a constant number of queries
+regardless of its size. URLs are built from templates reversed once per process.
+"""
+from django.core.urlresolvers import reverse
+
+# Digits match the patterns of all the URL parameters, slugs and ids alike
+_PLACEHOLDER = '987654321{}'
+_url_templates = {}
+
+
+def _url_template(name, *params):
+    template = _url_templates.get(name)
+    if template is None:
+        placeholders = {param: _PLACEHOLDER.format(i) for i, param in enumerate(params)}
+        template = reverse(name, kwargs=placeholders)
+        for param, placeholder in placeholders.items():
+            template = template.replace(placeholder, '{%s}' % param)
+        _url_templates[name] = template
+    return template
+
+
+def application_url(application):
+    return _url_template('application', 'app_slug').format(app_slug=application.slug)
+
+
+def resource_url(application, resource):
+    return _url_template('resource', 'app_slug', 'res_slug').format(
+        app_slug=application.slug, res_slug=resource.slug)
+
+
+def event_url(application, resource, event):
+    return _url_template('event', 'app_slug', 'res_slug', 'ev_slug').format(
+        app_slug=application.slug, res_slug=resource.slug, ev_slug=event.slug)
+
+
+def subscription_url(application, resource, event, subscription):
+    return _url_template('subscription', 'app_slug', 'res_slug', 'ev_slug', 'subs_id').format(
+        app_slug=application.slug, res_slug=resource.slug, ev_slug=event.slug, subs_id=subscription.id)
+
+
+def _ref(name, url):
+    return {"name": name, "url": url}
+
+
+def serialize_application(application):
+    events = application.events.select_related('resource')
+    resources = application.resources.all()
+    return {
+        "name": application.slug,
+        "url": application_url(application),
+        "modified": application.modified,
+        "created": application.created,
+        "data": {
+            "events": [_ref(ev.slug, event_url(application, ev.resource, ev)) for ev in events],
+            "resource": [_ref(res.slug, resource_url(application, res)) for res in resources]
+        }
+    }
+
+
+def serialize_resource(application, resource):
+    return {
+        "url": resource_url(application, resource),
+        "modified": resource.modified,
+        "created": resource.created,
+        "data": {
+            "name": resource.slug,
+            "data_fields": resource.data_fields,
+            "retention_days": resource.retention_days,
+            "application": _ref(application.slug, application_url(application))
+        }
+    }
+
+
+def serialize_event(application, resource, event):
+    return {
+        "url": event_url(application, resource, event),
+        "modified": event.modified,
+        "created": event.created,
+        "data": {
+            "resource": _ref(resource.slug, resource_url(application, resource)),
+            "application": _ref(application.slug, application_url(application)),
+            "name": event.slug,
+            "condition": event.condition,
+            "edge_triggered": event.edge_triggered
+        }
+    }
+
+
+def serialize_subscription(application, resource, event, subscription):
+    return {
+        "id": subscription.id,
+        "url": subscription_url(application, resource, event, subscription),
+        "modified": subscription.modified,
+        "created": subscription.created,
+        "data": {
+            "event": _ref(event.slug, event_url(application, resource, event)),
+            "resource": _ref(resource.slug, resource_url(application, resource)),
+            "application": _ref(application.slug, application_url(application)),
+            "notify_url": subscription.notify_url,
+            "min_interval": subscription.min_interval,
+            "debounce": subscription.debounce,
+            "batch_window": subscription.batch_window,
+            "batch_size": subscription.batch_size
+        }
+    }
+
+
+def serialize_snapshot(application, resources, states, fields=None):
+    """
+    Returns the latest state of every resource of the application by resource
+    name, with the data narrowed down to the given fields if any.
+    """
+    snapshot = {}
+    for resource in resources:
+        state = states.get(resource.id)
+        entry = {"url": resource_url(application, resource), "data": None, "time": None}
+        if state:
+            data = state['data']
+            if fields is not None:
+                data = {field: data[field] for field in fields if field in data}
+            entry["data"], entry["time"] = data, state['time']
+        snapshot[resource.slug] = entry
+
+    return {
+        "name": application.slug,
+        "url": application_url(application),
+        "resources": snapshot
+    }
@@ -9,15 +9,24 @@ Application API:
 /<app-slug>
     - GET: Get all info about the application
 
+/<app-slug>/snapshot
+    - GET: Read the latest state of all the resources of the application
+
 Resources API:
 /<app-slug>/resources
-    - POST: Create a resource for the app
+    - POST: Create a resource for the app, or post a batch of resource states
     - GET: List all resources of the app
 
 /<app-slug>/resources/<res-slug>
-    - POST: Post the latest state of the resource
+    - POST: Post the latest state of the resource, or a batch of states
     - GET: Read the latest state of the resource
 
+/<app-slug>/resources/<res-slug>/data
+    - GET: Read the history of the resource, optionally downsampled
+
+/<app-slug>/resources/<res-slug>/stream
+    - GET: Stream the new states of the resource via Server-Sent Events or long-polling
+
 Events API:
 /<app-slug>/resources/<res-slug>/events
     - POST: Create an event for the resource
@@ -42,6 +51,8 @@ Event Subscription API:
 
 urlpatterns = [
     url(r'^(?P<app_slug>[\w-]+)/$', views.ApplicationApi.as_view(), name='application'),
+    url(r'^(?P<app_slug>[\w-]+)/snapshot/$', views.ApplicationSnapshotApiView.as_view(),
+        name='application-snapshot'),
     url(r'^(?P<app_slug>[\w-]+)/resources/(?P<res_slug>[\w-]+)/events/(?P<ev_slug>[\w-]+)/subscriptions/(?P<subs_id>\d+)/$',
         views.EventSubscriptionApiView.as_view(), name='subscription'),
     url(r'^(?P<app_slug>[\w-]+)/resources/(?P<res_slug>[\w-]+)/events/(?P<ev_slug>[\w-]+)/subscriptions/$',
@@ -49,6 +60,10 @@ urlpatterns = [
     url(r'^(?P<app_slug>[\w-]+)/resources/(?P<res_slug>[\w-]+)/events/(?P<ev_slug>[\w-]+)/',
         views.EventApiView.as_view(), name='event'),
     url(r'^(?P<app_slug>[\w-]+)/resources/(?P<res_slug>[\w-]+)/events/$', views.EventApiView.as_view(), name='event-list'),
+    url(r'^(?P<app_slug>[\w-]+)/resources/(?P<res_slug>[\w-]+)/data/$', views.ResourceDataApiView.as_view(),
+        name='resource-data'),
+    url(r'^(?P<app_slug>[\w-]+)/resources/(?P<res_slug>[\w-]+)/stream/?$', views.ResourceStreamApiView.as_view(),
+        name='resource-stream'),
     url(r'^(?P<app_slug>[\w-]+)/resources/(?P<res_slug>[\w-]+)/', views.ResourceApiView.as_view(), name='resource'),
     url(r'^(?P<app_slug>[\w-]+)/resources/$', views.ResourceApiView.as_view(), name='resource-list'),
 ]
\ No newline at end of file
@@ -1,17 +1,38 @@
+import ipaddress
 import json
 import logging
+import time
+from functools import partial
 
 from braces.views import JsonRequestResponseMixin, CsrfExemptMixin
 from django import http
-from django.http.response import HttpResponse, HttpResponseForbidden, HttpResponseBadRequest
+from django.conf import settings
+from django.http.response import HttpResponse, HttpResponseForbidden, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils.decorators import method_decorator
+from django.utils.cache import patch_vary_headers
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import View
 from oauth2_provider.views.generic import ProtectedResourceMixin
 
+from wot_app.api.codecs import RequestBodyTooLarge, UnsupportedMediaType, decode_body, encode_body, negotiate
+from wot_app.api.conditional import conditional_response, make_etag, object_validators, stamp_validators
+from wot_app.api.resolvers import resolve_api_objects
+from wot_app.api.renderers import stream_json_array, iterate_in_chunks, paginate_queryset
+from wot_app.api.serializers import (serialize_application, serialize_resource, serialize_event, serialize_subscription,
+                                     serialize_snapshot)
+from wot_app.caching import touch_stamp, APPLICATION_STAMP_KEY, RESOURCE_STAMP_KEY, EVENT_STAMP_KEY
+from wot_app.conditions import update_event_index
+from wot_app.definitions import invalidate_event_definition
 from wot_app.exceptions import InvalidResourceDataException
+from wot_app.history import parse_time, query_resource_data, downsample_resource_data
+from wot_app import writebehind
+from wot_app.ingest import write_resource_data, write_resource_data_batch, validate_resource_data_batch
+from wot_app.metrics import render_metrics
 from wot_app.models import Application, Resource, Event, ResourceData, EventSubscription
+from wot_app.pubsub import broker
+from wot_app.state import get_latest_state, get_latest_states
+from wot_app.triggers import reset_event_state
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +41,7 @@ class ProtectedResourceApiMixin(ProtectedResourceMixin):
     def dispatch(self, request, *args, **kwargs):
         if (
             request.application.is_private and
-            request.application != request.access_token.application
+            (request.access_token is None or request.application != request.access_token.application)
         ):
             return HttpResponseForbidden()
         else:
@@ -28,12 +49,21 @@ class ProtectedResourceApiMixin(ProtectedResourceMixin):
 
 
 class ResourceApiBaseView(View):
-    def _fetch_resource_objects(self, view_kwargs):
-        app_slug = view_kwargs.get('app_slug')
-        self.application = get_object_or_404(Application, slug=app_slug)
+    def _fetch_resource_objects(self, request, view_kwargs):
+        # Resolved by OauthApplicationMiddleware for API requests
+        self.application = getattr(request, 'application', None)
+        if self.application is None:
+            app_slug = view_kwargs.get('app_slug')
+            self.application = get_object_or_404(Application, slug=app_slug)
+
+        self.resource, self.event, self.subscription = resolve_api_objects(
+            self.application,
+            res_slug=view_kwargs.get('res_slug'),
+            ev_slug=view_kwargs.get('ev_slug'),
+            subs_id=view_kwargs.get('subs_id'))
 
     def dispatch(self, request, *args, **kwargs):
-        self._fetch_resource_objects(kwargs)
+        self._fetch_resource_objects(request, kwargs)
 
         if self.application is None:
             logger.warning('Application not found from slug')
@@ -42,7 +72,67 @@ class ResourceApiBaseView(View):
         return super().dispatch(request, *args, **kwargs)
 
 
-class ProtectedRestApiView(ProtectedResourceApiMixin, JsonRequestResponseMixin, ResourceApiBaseView):
+class ContentNegotiationMixin:
+    """
+    Reads request bodies in JSON, MessagePack or CBOR, optionally gzipped,
+    and renders responses in the type the client accepts, JSON by default,
+    with the fast encoders. See wot_app.api.codecs.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except UnsupportedMediaType as e:
+            logger.warning('Unsupported request body: %s', e)
+            return HttpResponse(status=415)
+        except RequestBodyTooLarge:
+            logger.warning('Decompressed request body is too large -- %s', request.path)
+            return HttpResponse(status=413)
+
+    def get_request_json(self):
+        try:
+            return decode_body(self.request.body, self.request.META.get('CONTENT_TYPE'),
+                               self.request.META.get('HTTP_CONTENT_ENCODING'))
+        except ValueError:
+            return None
+
+    def render_json_response(self, context_dict, status=200):
+        media_type = negotiate(self.request.META.get('HTTP_ACCEPT'))
+        response = HttpResponse(encode_body(context_dict, media_type), content_type=media_type, status=status)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+
+class ListResponseMixin:
+    """
+    Renders list endpoints either as pages with a Link header to the next page
+    or, with ?stream=1, as a streamed JSON array.
+    """
+    max_page_size = 1000
+
+    def render_list_response(self, queryset, serialize):
+        if self.request.GET.get('stream') in ('1', 'true'):
+            return stream_json_array(serialize(obj) for obj in iterate_in_chunks(queryset))
+
+        try:
+            limit = min(int(self.request.GET.get('limit', self.max_page_size)), self.max_page_size)
+            if limit <= 0:
+                raise ValueError('Limit should be positive')
+            page, next_cursor = paginate_queryset(queryset, self.request.GET.get('cursor'), limit)
+        except ValueError:
+            logger.exception('Invalid list query -- %s', self.request.GET.urlencode())
+            return HttpResponseBadRequest()
+
+        response = self.render_json_response([serialize(obj) for obj in page])
+        if next_cursor:
+            params = self.request.GET.copy()
+            params['cursor'] = next_cursor
+            response['Link'] = '<{}?{}>; rel="next"'.format(self.request.path, params.urlencode())
+        return response
+
+
+class ProtectedRestApiView(ProtectedResourceApiMixin, ListResponseMixin, ContentNegotiationMixin,
+                          JsonRequestResponseMixin, ResourceApiBaseView):
     from oauth2_provider.settings import oauth2_settings
 
     server_class = oauth2_settings.OAUTH2_SERVER_CLASS
@@ -52,42 +142,71 @@ class ProtectedRestApiView(ProtectedResourceApiMixin, JsonRequestResponseMixin,
 
 class ResourceApiView(CsrfExemptMixin, ProtectedRestApiView):
 
-    @method_decorator(csrf_exempt)
-    def dispatch(self, request, *args, **kwargs):
-        self.resource = None
-        res_slug = kwargs.get('res_slug')
-        if res_slug:
-            self.resource = get_object_or_404(Resource, slug=res_slug)
-
-        return super().dispatch(request, *args, **kwargs)
-
     def get(self, request, *args, **kwargs):
         logger.info('ResourceApiView.get called')
 
-        if self.resource:
-            resource_data = self.resource.all_data.order_by('id').last()
-            if resource_data:
-                data = {'data': resource_data.data, 'time': resource_data.created}
-            else:
-                data = {}
-        else:
-            data = [res.to_dict for res in self.application.resources.all()]
+        if not self.resource:
+            etag, last_modified = stamp_validators(APPLICATION_STAMP_KEY.format(self.application.id), request,
+                                                   self.application)
+            return conditional_response(request, etag, last_modified, lambda: self.render_list_response(
+                self.application.resources.all(), partial(serialize_resource, self.application)))
 
-        return self.render_json_response(data)
+        state = get_latest_state(self.resource)
+        if state:
+            data = {'data': state['data'], 'time': state['time']}
+            etag, last_modified = make_etag(self.resource.id, state['id'], state['time'].isoformat()), state['time']
+        else:
+            data = {}
+            etag, last_modified = make_etag(self.resource.id, None), None
+        return conditional_response(request, etag, last_modified, lambda: self.render_json_response(data))
 
     def post(self, request, *args, **kwargs):
         if self.resource:
             return self._write_resource_data()
+        elif isinstance(self.request_json, list):
+            return self._write_application_data()
         else:
             return self._create_resource()
 
     def _write_resource_data(self):
         data = self.request_json
         try:
-            ResourceData.objects.create(data=data, resource=self.resource)
+            if writebehind.is_enabled():
+                samples = self.resource.validate_data_batch(data if isinstance(data, list) else [data])
+                writebehind.enqueue_resource_data_batch({self.resource: samples})
+                return HttpResponse(status=202)
+            elif isinstance(data, list):
+                write_resource_data(self.resource, data)
+            else:
+                ResourceData.objects.create(data=data, resource=self.resource)
+            return HttpResponse(status=200)
+        except InvalidResourceDataException as e:
+            logger.warning('Resource data does not conform to specified structure: %s', e.errors)
+            return self.render_bad_request_response({'errors': e.errors})
+
+    def _write_application_data(self):
+        samples = self.request_json
+        try:
+            res_slugs = {sample['resource'] for sample in samples}
+            resources = {res.slug: res for res in self.application.resources.filter(slug__in=res_slugs)}
+            if len(resources) != len(res_slugs):
+                logger.warning('Unknown resources in batch: %s', res_slugs.difference(resources))
+                return HttpResponseBadRequest()
+
+            samples_by_resource = {res: [] for res in resources.values()}
+            for sample in samples:
+                samples_by_resource[resources[sample['resource']]].append(sample['data'])
+
+            if writebehind.is_enabled():
+                writebehind.enqueue_resource_data_batch(validate_resource_data_batch(samples_by_resource))
+                return HttpResponse(status=202)
+            write_resource_data_batch(samples_by_resource)
             return HttpResponse(status=200)
-        except InvalidResourceDataException:
-            logger.exception('Resource data does not conform to specified structure')
+        except InvalidResourceDataException as e:
+            logger.warning('Resource data batch does not conform to specified structure: %s', e.errors)
+            return self.render_bad_request_response({'errors': e.errors})
+        except (KeyError, TypeError):
+            logger.exception('Resource data batch does not conform to specified structure')
             return HttpResponseBadRequest()
 
     def _create_resource(self):
@@ -104,29 +223,119 @@ class ResourceApiView(CsrfExemptMixin, ProtectedRestApiView):
             return HttpResponseBadRequest()
 
 
-class EventApiView(CsrfExemptMixin, ProtectedRestApiView):
+class ResourceDataApiView(CsrfExemptMixin, ProtectedRestApiView):
+    default_limit = 100
+    max_limit = 1000
 
-    @method_decorator(csrf_exempt)
-    def dispatch(self, request, *args, **kwargs):
-        self.resource = None
-        res_slug = kwargs.get('res_slug')
-        if res_slug:
-            self.resource = get_object_or_404(Resource, slug=res_slug)
+    def get(self, request, *args, **kwargs):
+        try:
+            start = parse_time(request.GET.get('from'))
+            end = parse_time(request.GET.get('to'))
+            bucket = request.GET.get('bucket')
+            if bucket is not None:
+                bucket = int(bucket)
+                if bucket <= 0 or start is None or end is None:
+                    raise ValueError('Downsampling needs a positive bucket and a from/to range')
+                if (end - start).total_seconds() / bucket > getattr(settings, 'WOT_HISTORY_MAX_BUCKETS', 10000):
+                    raise ValueError('Downsampling range spans too many buckets')
+                data = downsample_resource_data(self.resource, start, end, bucket)
+                return self.render_json_response({'bucket': bucket, 'data': data})
+
+            limit = min(int(request.GET.get('limit', self.default_limit)), self.max_limit)
+            if limit <= 0:
+                raise ValueError('Limit should be positive')
+            data, next_cursor = query_resource_data(self.resource, start, end, request.GET.get('cursor'), limit)
+        except ValueError:
+            logger.exception('Invalid resource data query -- %s', request.GET.urlencode())
+            return HttpResponseBadRequest()
 
-        self.event = None
-        ev_slug = kwargs.get('ev_slug')
-        if ev_slug:
-            self.event = get_object_or_404(Event, slug=ev_slug)
+        next_url = None
+        if next_cursor:
+            params = request.GET.copy()
+            params['cursor'] = next_cursor
+            next_url = '{}?{}'.format(request.path, params.urlencode())
 
-        return super().dispatch(request, *args, **kwargs)
+        return self.render_json_response({'data': data, 'next': next_url})
+
+
+class ResourceStreamApiView(CsrfExemptMixin, ProtectedRestApiView):
+    heartbeat = 15
+    default_poll_timeout = 30
+    max_poll_timeout = 60
+
+    def get(self, request, *args, **kwargs):
+        include_events = request.GET.get('events') in ('1', 'true')
+        if request.GET.get('poll') in ('1', 'true'):
+            return self._long_poll(request, include_events)
+
+        response = StreamingHttpResponse(self._event_stream(broker.subscribe(self.resource.id), include_events),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _event_stream(self, subscriber, include_events):
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                message = subscriber.get(timeout=self.heartbeat)
+                if message is None:
+                    yield ': keep-alive\n\n'
+                elif include_events or message['type'] == 'data':
+                    event_id = 'id: {}\n'.format(message['id']) if message['id'] is not None else ''
+                    yield '{}event: {}\ndata: {}\n\n'.format(event_id, message['type'], json.dumps(message))
+        finally:
+            broker.unsubscribe(subscriber)
+
+    def _long_poll(self, request, include_events):
+        try:
+            timeout = min(float(request.GET.get('timeout', self.default_poll_timeout)), self.max_poll_timeout)
+            last_id = request.GET.get('last_id')
+            last_id = int(last_id) if last_id else None
+        except ValueError:
+            logger.exception('Invalid long-poll query -- %s', request.GET.urlencode())
+            return HttpResponseBadRequest()
+
+        # Subscribe first so that nothing written during the state check is lost
+        subscriber = broker.subscribe(self.resource.id)
+        try:
+            state = get_latest_state(self.resource)
+            if last_id is not None and state and state['id'] is not None and state['id'] > last_id:
+                return self.render_json_response([{'type': 'data', 'id': state['id'], 'data': state['data'],
+                                                   'time': state['time']}])
+
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                message = subscriber.get(timeout=remaining) if remaining > 0 else None
+                if message is None:
+                    return HttpResponse(status=204)
+
+                messages = [message]
+                message = subscriber.get(timeout=0)
+                while message is not None:
+                    messages.append(message)
+                    message = subscriber.get(timeout=0)
+
+                messages = [msg for msg in messages if include_events or msg['type'] == 'data']
+                if messages:
+                    return self.render_json_response(messages)
+        finally:
+            broker.unsubscribe(subscriber)
+
+
+class EventApiView(CsrfExemptMixin, ProtectedRestApiView):
 
     def get(self, request, *args, **kwargs):
         logger.info('EventApiView.get called')
         if self.event:
-            data = self.event.to_dict
+            etag, last_modified = object_validators(self.event)
+            return conditional_response(request, etag, last_modified, lambda: self.render_json_response(
+                serialize_event(self.application, self.resource, self.event)))
         else:
-            data = [ev.to_dict for ev in self.resource.events.all()]
-        return self.render_json_response(data)
+            etag, last_modified = stamp_validators(RESOURCE_STAMP_KEY.format(self.resource.id), request)
+            return conditional_response(request, etag, last_modified, lambda: self.render_list_response(
+                self.resource.events.all(), partial(serialize_event, self.application, self.resource)))
 
     def post(self, request, *args, **kwargs):
         if self.event:
@@ -150,36 +359,31 @@ class EventApiView(CsrfExemptMixin, ProtectedRestApiView):
 
         data = self.request_json
         try:
-            Event.objects.filter(pk=self.event.pk).update(**data)
+            Event.objects.filter(pk=self.event.pk).update(modified=timezone.now(), **data)
+            touch_stamp(APPLICATION_STAMP_KEY.format(self.application.id))
+            touch_stamp(RESOURCE_STAMP_KEY.format(self.resource.id))
+            update_event_index(Event.objects.get(pk=self.event.pk))
+            reset_event_state(self.event)
+            invalidate_event_definition(self.event.pk)
             return HttpResponse(status=200)
         except:
             logger.exception('Update event failed -- payload:\n%s', data)
             return HttpResponseBadRequest()
 
 
-class EventSubscriptionApiView(ProtectedRestApiView):
-
-    @method_decorator(csrf_exempt)
-    def dispatch(self, request, *args, **kwargs):
-        self.subscription = None
-        self.event = None
-        ev_slug = kwargs.get('ev_slug')
-        if ev_slug:
-            self.event = get_object_or_404(Event, slug=ev_slug)
-
-        subs_id = kwargs.get('subs_id')
-        if subs_id:
-            self.subscription = get_object_or_404(EventSubscription, id=subs_id)
-
-        return super().dispatch(request, *args, **kwargs)
+class EventSubscriptionApiView(CsrfExemptMixin, ProtectedRestApiView):
 
     def get(self, request, *args, **kwargs):
         logger.info('EventApiView.get called')
         if self.subscription:
-            data = self.subscription.to_dict
+            etag, last_modified = object_validators(self.subscription)
+            return conditional_response(request, etag, last_modified, lambda: self.render_json_response(
+                serialize_subscription(self.application, self.resource, self.event, self.subscription)))
         else:
-            data = [subs.to_dict for subs in self.event.subscriptions.all()]
-        return self.render_json_response(data)
+            etag, last_modified = stamp_validators(EVENT_STAMP_KEY.format(self.event.id), request)
+            return conditional_response(request, etag, last_modified, lambda: self.render_list_response(
+                self.event.subscriptions.all(),
+                partial(serialize_subscription, self.application, self.resource, self.event)))
 
     def post(self, request, *args, **kwargs):
         if not self.event or self.subscription:
@@ -203,7 +407,9 @@ class EventSubscriptionApiView(ProtectedRestApiView):
 
         data = self.request_json
         try:
-            EventSubscription.objects.filter(pk=self.subscription.pk).update(**data)
+            EventSubscription.objects.filter(pk=self.subscription.pk).update(modified=timezone.now(), **data)
+            touch_stamp(EVENT_STAMP_KEY.format(self.event.id))
+            invalidate_event_definition(self.subscription.event_id)
             return HttpResponse(status=200)
         except:
             logger.exception('Update event subscription failed -- payload:\n%s', data)
@@ -221,11 +427,37 @@ class EventSubscriptionApiView(ProtectedRestApiView):
             return HttpResponseBadRequest()
 
 
-class ApplicationApi(JsonRequestResponseMixin, View):
+class ApplicationApi(ContentNegotiationMixin, JsonRequestResponseMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        application = getattr(request, 'application', None)
+        if application is None:
+            application = get_object_or_404(Application, slug=kwargs.get('app_slug'))
+        etag, last_modified = stamp_validators(APPLICATION_STAMP_KEY.format(application.id), request, application)
+        return conditional_response(request, etag, last_modified,
+                                    lambda: self.render_json_response(serialize_application(application)))
+
+
+class ApplicationSnapshotApiView(CsrfExemptMixin, ProtectedRestApiView):
+    """
+    The latest state of all the resources of the application, protected like
+    the state of a single resource.
+    """
 
     def get(self, request, *args, **kwargs):
-        application = get_object_or_404(Application, slug=kwargs.get('app_slug'))
-        return self.render_json_response(application.to_dict)
+        fields = request.GET.get('fields')
+        fields = [field for field in fields.split(',') if field] if fields else None
+
+        resources = list(self.application.resources.order_by('id'))
+        states = get_latest_states(resources)
+
+        # The stamp covers the resources themselves, the state ids their latest data
+        etag, last_modified = stamp_validators(APPLICATION_STAMP_KEY.format(self.application.id), request,
+                                               self.application)
+        etag = make_etag(etag, *(state and (state['id'], state['time']) for _, state in sorted(states.items())))
+        last_modified = max([last_modified] + [state['time'] for state in states.values() if state])
+        return conditional_response(request, etag, last_modified, lambda: self.render_json_response(
+            serialize_snapshot(self.application, resources, states, fields)))
 
 
 @csrf_exempt
@@ -236,4 +468,19 @@ def notification_endpoint(request, *args, **kwargs):
     except:
         logger.exception('Notification handler failed')
 
-    return HttpResponse(status=200)
\ No newline at end of file
+    return HttpResponse(status=200)
+
+
+def _metrics_allowed(request):
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    networks = getattr(settings, 'WOT_METRICS_ALLOWED_NETWORKS', ('127.0.0.1/32', '::1/128'))
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def metrics_endpoint(request, *args, **kwargs):
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
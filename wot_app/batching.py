@@ -0,0 +1,59 @@
+"""
+Batched notification delivery.
+
+Subscriptions with batch_window collect their notifications in a Redis list
+per notify_url, shared by all the events notifying that URL. The list is
+delivered as one POST with an array payload when it holds batch_size
+notifications or batch_window seconds after its first notification was added,
+whichever comes first. Notifications are ordered by the time of the resource
+data that triggered them, so those of an event keep their order in a batch.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+
+from wot_app.pubsub import get_redis
+
+logger = logging.getLogger(__name__)
+
+BATCH_KEY = 'wot:notification-batch:{}'
+
+
+def batch_size(subscription):
+    return subscription.batch_size or getattr(settings, 'WOT_WEBHOOK_BATCH_SIZE', 100)
+
+
+def _batch_key(notify_url):
+    return BATCH_KEY.format(hashlib.sha1(notify_url.encode()).hexdigest())
+
+
+def add_to_batch(subscription, event_data, time):
+    """
+    Adds a notification to the batch of the notify URL of the subscription and
+    returns the size of the batch, None if it could not be added.
+    """
+    try:
+        return get_redis().rpush(_batch_key(subscription.notify_url),
+                                 json.dumps({'time': time, 'event': event_data}))
+    except Exception:
+        logger.exception('Batching a notification for %s failed', subscription.notify_url)
+        return None
+
+
+def take_batch(notify_url, size):
+    """
+    Removes up to size of the oldest notifications of the notify URL and
+    returns their payloads in order with the number of those left behind.
+    """
+    key = _batch_key(notify_url)
+    pipeline = get_redis().pipeline(transaction=True)
+    pipeline.lrange(key, 0, size - 1)
+    pipeline.ltrim(key, size, -1)
+    pipeline.llen(key)
+    items, _, remaining = pipeline.execute()
+
+    items = [json.loads(item.decode()) for item in items]
+    items.sort(key=lambda item: item['time'] or '')
+    return [item['event'] for item in items], remaining
@@ -0,0 +1,45 @@
+import uuid
+
+from django.core.cache import cache
+from django.utils import timezone
+
+# Stamps of the listings below an application, a resource and an event
+APPLICATION_STAMP_KEY = 'wot:stamp:application:{}'
+RESOURCE_STAMP_KEY = 'wot:stamp:resource:{}'
+EVENT_STAMP_KEY = 'wot:stamp:event:{}'
+
+
+def get_version(key):
+    return cache.get(key, 0)
+
+
+def bump_version(key):
+    """
+    Increments a version counter shared by all processes through the cache
+    and returns the new version.
+    """
+    if cache.add(key, 1, timeout=None):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def get_stamp(key):
+    """
+    Returns the (token, modified time) stamp of a group of objects, e.g. the
+    events of a resource. A missing stamp is created as if the group had just
+    changed, so an evicted stamp can only cause a refetch, never a stale hit.
+    """
+    stamp = cache.get(key)
+    if stamp is None:
+        stamp = (uuid.uuid4().hex, timezone.now())
+        if not cache.add(key, stamp, timeout=None):
+            stamp = cache.get(key, stamp)
+    return stamp
+
+
+def touch_stamp(key):
+    cache.set(key, (uuid.uuid4().hex, timezone.now()), timeout=None)
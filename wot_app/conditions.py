@@ -0,0 +1,261 @@
+import logging
+import operator
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from numbers import Real
+
+from wot_app import metrics
+from wot_app.caching import get_version, bump_version
+from wot_app.triggers import filter_transitions
+
+logger = logging.getLogger(__name__)
+
+EVENTS_VERSION_KEY = 'wot:events:version:{}'
+
+RANGE_OPERATORS = ('gt', 'ge', 'lt', 'le')
+HASH_OPERATORS = ('eq', 'ne')
+
+
+class CompiledCondition:
+    """
+    Predicate compiled from an event condition, e.g. [["illuminance", "gt", 50]].
+    All the clauses of the condition should hold for the predicate to match.
+    """
+
+    def __init__(self, condition):
+        self.condition = condition
+        self.clauses = [(field, getattr(operator, opstr), value) for field, opstr, value in condition]
+
+    def __call__(self, data):
+        try:
+            return all(op(data[field], value) for field, op, value in self.clauses)
+        except Exception:
+            logger.exception('Error occurred while checking event condition')
+            return False
+
+
+class _ThresholdList:
+    """
+    Thresholds of a (field, operator) pair kept sorted along with their event ids.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.event_ids = []
+
+    def add(self, value, event_id):
+        pos = bisect_right(self.values, value)
+        self.values.insert(pos, value)
+        self.event_ids.insert(pos, event_id)
+
+    def remove(self, value, event_id):
+        lo, hi = bisect_left(self.values, value), bisect_right(self.values, value)
+        pos = self.event_ids.index(event_id, lo, hi)
+        del self.values[pos]
+        del self.event_ids[pos]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class EventConditionIndex:
+    """
+    Index over the conditions of the events of a resource.
+
+    Every event is indexed by one of its clauses, keyed by (field, operator):
+    range operators keep sorted threshold arrays and eq/ne keep hash sets, so
+    the candidates for a sample are found with a binary search or a hash
+    lookup. The remaining clauses are verified on the candidates only. Events
+    without an indexable clause are checked linearly.
+    """
+
+    def __init__(self, events=()):
+        self.events = {}
+        self._anchors = {}
+        self._ranges = defaultdict(_ThresholdList)
+        self._equals = defaultdict(lambda: defaultdict(set))
+        self._not_equals = defaultdict(lambda: defaultdict(set))
+        self._not_equals_all = defaultdict(set)
+        self._unindexed = set()
+        self.edge_triggered = {}
+        for event in events:
+            self.add(event)
+
+    def __len__(self):
+        return len(self.events)
+
+    @staticmethod
+    def _find_anchor(condition):
+        for field, opstr, value in condition:
+            if opstr in RANGE_OPERATORS and isinstance(value, Real) and not isinstance(value, bool):
+                return field, opstr, value
+            if opstr in HASH_OPERATORS:
+                try:
+                    hash(value)
+                except TypeError:
+                    continue
+                return field, opstr, value
+        return None
+
+    def add(self, event):
+        try:
+            predicate = CompiledCondition(event.condition)
+        except Exception:
+            logger.exception('Invalid condition for event %s', event.slug)
+            return
+
+        self.events[event.id] = (event, predicate)
+        if getattr(event, 'edge_triggered', False):
+            self.edge_triggered[event.id] = event
+        anchor = self._find_anchor(event.condition)
+        self._anchors[event.id] = anchor
+        if anchor is None:
+            self._unindexed.add(event.id)
+            return
+
+        field, opstr, value = anchor
+        if opstr in RANGE_OPERATORS:
+            self._ranges[field, opstr].add(value, event.id)
+        elif opstr == 'eq':
+            self._equals[field][value].add(event.id)
+        else:
+            self._not_equals[field][value].add(event.id)
+            self._not_equals_all[field].add(event.id)
+
+    def discard(self, event_id):
+        if event_id not in self.events:
+            return
+
+        del self.events[event_id]
+        self.edge_triggered.pop(event_id, None)
+        anchor = self._anchors.pop(event_id)
+        if anchor is None:
+            self._unindexed.discard(event_id)
+            return
+
+        field, opstr, value = anchor
+        if opstr in RANGE_OPERATORS:
+            self._ranges[field, opstr].remove(value, event_id)
+        elif opstr == 'eq':
+            self._discard_from(self._equals[field], value, event_id)
+        else:
+            self._discard_from(self._not_equals[field], value, event_id)
+            self._not_equals_all[field].discard(event_id)
+
+    @staticmethod
+    def _discard_from(buckets, value, event_id):
+        buckets[value].discard(event_id)
+        if not buckets[value]:
+            del buckets[value]
+
+    def _candidates(self, data):
+        candidates = list(self._unindexed)
+        for field, x in data.items():
+            try:
+                candidates.extend(self._range_candidates(field, x))
+            except TypeError:
+                # Sample value is not comparable with numeric thresholds
+                pass
+
+            try:
+                hash(x)
+            except TypeError:
+                # Unhashable sample value, e.g. a list; its eq/ne events are
+                # left to their predicates
+                for event_ids in self._equals.get(field, {}).values():
+                    candidates.extend(event_ids)
+                candidates.extend(self._not_equals_all.get(field, ()))
+                continue
+
+            equals = self._equals.get(field)
+            if equals:
+                candidates.extend(equals.get(x, ()))
+
+            not_equals = self._not_equals.get(field)
+            if not_equals:
+                candidates.extend(self._not_equals_all[field].difference(not_equals.get(x, ())))
+        return candidates
+
+    def _range_candidates(self, field, x):
+        thresholds = self._ranges.get((field, 'gt'))
+        if thresholds:
+            yield from thresholds.event_ids[:bisect_left(thresholds.values, x)]
+
+        thresholds = self._ranges.get((field, 'ge'))
+        if thresholds:
+            yield from thresholds.event_ids[:bisect_right(thresholds.values, x)]
+
+        thresholds = self._ranges.get((field, 'lt'))
+        if thresholds:
+            yield from thresholds.event_ids[bisect_right(thresholds.values, x):]
+
+        thresholds = self._ranges.get((field, 'le'))
+        if thresholds:
+            yield from thresholds.event_ids[bisect_left(thresholds.values, x):]
+
+    def match(self, data):
+        matched = []
+        for event_id in self._candidates(data):
+            event, predicate = self.events[event_id]
+            if predicate(data):
+                matched.append(event)
+        return matched
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_event_index(resource):
+    """
+    Returns the cached condition index of the resource, rebuilding it when the
+    events of the resource have been changed by another process.
+    """
+    version = get_version(EVENTS_VERSION_KEY.format(resource.id))
+    cached = _indexes.get(resource.id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    index = EventConditionIndex(resource.events.all())
+    with _indexes_lock:
+        _indexes[resource.id] = (version, index)
+    return index
+
+
+def update_event_index(event, deleted=False):
+    """
+    Applies a created, updated or deleted event to the index of its resource
+    in this process and signals the change to the other processes.
+    """
+    version = bump_version(EVENTS_VERSION_KEY.format(event.resource_id))
+    with _indexes_lock:
+        cached = _indexes.pop(event.resource_id, None)
+        if cached is None or cached[0] != version - 1:
+            # Missed a change made elsewhere; the index is rebuilt on next use
+            return
+
+        index = cached[1]
+        index.discard(event.id)
+        if not deleted:
+            index.add(event)
+        _indexes[event.resource_id] = (version, index)
+
+
+def match_events(resource, resource_data_list):
+    """
+    Evaluates all the events of the resource against a batch of resource data
+    and returns the (event, resource_data) pairs that match. Edge-triggered
+    events match only the data that turns their condition true.
+    """
+    index = get_event_index(resource)
+    if not index:
+        return []
+
+    with metrics.stage_seconds.time(stage='condition_evaluation'):
+        occurrences = [(event, resource_data)
+                       for resource_data in resource_data_list
+                       for event in index.match(resource_data.data)]
+        if index.edge_triggered:
+            occurrences = filter_transitions(resource.id, index.edge_triggered, resource_data_list, occurrences)
+    return occurrences
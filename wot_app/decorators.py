@@ -23,7 +23,7 @@ def filter_paths(include=None, exclude=None):
                     return
 
                 if hasattr(cls, 'process_request'):
-                    super().proces_request(request)
+                    return super().process_request(request)
 
             def process_response(self, request, response):
                 if should_skip(request.path, include, exclude):
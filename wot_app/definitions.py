@@ -0,0 +1,59 @@
+import threading
+from collections import namedtuple
+
+from wot_app.caching import get_version, bump_version
+from wot_app.models import Event
+
+EVENT_DEFINITION_VERSION_KEY = 'wot:event-definition:version:{}'
+
+EventDefinition = namedtuple('EventDefinition', ['id', 'name', 'application', 'resource', 'subscriptions'])
+SubscriptionDefinition = namedtuple('SubscriptionDefinition', ['id', 'notify_url', 'min_interval', 'debounce',
+                                                               'batch_window', 'batch_size'])
+
+_definitions = {}
+_definitions_lock = threading.Lock()
+
+
+def get_event_definition(event_id):
+    """
+    Returns what workers need to know about an event to notify its subscribers,
+    cached in the process until the event or its subscriptions change.
+    Returns None if the event has been deleted.
+    """
+    version = get_version(EVENT_DEFINITION_VERSION_KEY.format(event_id))
+    cached = _definitions.get(event_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    try:
+        event = Event.objects.select_related('application', 'resource').get(pk=event_id)
+    except Event.DoesNotExist:
+        return None
+    definition = EventDefinition(
+        id=event.id,
+        name=event.slug,
+        application=event.application.slug,
+        resource=event.resource.slug,
+        subscriptions=tuple(SubscriptionDefinition(*values) for values in event.subscriptions.values_list(
+            'id', 'notify_url', 'min_interval', 'debounce', 'batch_window', 'batch_size')))
+
+    with _definitions_lock:
+        _definitions[event_id] = (version, definition)
+    return definition
+
+
+def invalidate_event_definition(event_id):
+    bump_version(EVENT_DEFINITION_VERSION_KEY.format(event_id))
+    with _definitions_lock:
+        _definitions.pop(event_id, None)
+
+
+def resource_data_payload(resource_data):
+    """
+    Compact, JSON serializable form of a resource data sample for task messages.
+    """
+    return {
+        'id': resource_data.id,
+        'data': resource_data.data,
+        'time': resource_data.created.isoformat() if resource_data.created else None,
+    }
@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from wot_app import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class HostRateLimiter:
+    """
+    Token bucket limiting the rate of requests sent to a single host.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(float(burst), 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after threshold consecutive failures. Once the
+    cooldown is over a single trial request is let through, which closes the
+    circuit if it succeeds and opens it for another cooldown if it fails.
+    """
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened is None:
+                return True
+            if time.monotonic() - self.opened >= self.cooldown:
+                # Half-open: this request is the trial, the others wait for its result
+                self.opened = time.monotonic()
+                return True
+            return False
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened = time.monotonic()
+
+
+# Why a notification was not delivered, and whether it is worth retrying
+DeliveryFailure = namedtuple('DeliveryFailure', ['error', 'retryable'])
+
+
+class WebhookDeliveryEngine:
+    """
+    Delivers webhook notifications concurrently over keep-alive connection
+    pools, one pool per host, with per-request timeouts, an optional per-host
+    rate limit and a per-host circuit breaker.
+    """
+
+    def __init__(self, max_workers=20, pool_size=10, timeout=10, rate_limit=None, rate_burst=1,
+                 breaker_threshold=5, breaker_cooldown=30):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._sessions = {}
+        self._limiters = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _get_session(self, host):
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._sessions[host] = session
+        return session
+
+    def _get_limiter(self, host):
+        if not self.rate_limit:
+            return None
+
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.setdefault(host, HostRateLimiter(self.rate_limit, self.rate_burst))
+        return limiter
+
+    def _get_breaker(self, host):
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(host, CircuitBreaker(self.breaker_threshold,
+                                                                         self.breaker_cooldown))
+        return breaker
+
+    def post(self, url, payload):
+        """
+        Sends a notification, returns None if it is delivered and a
+        DeliveryFailure otherwise.
+        """
+        host = metrics.url_host(url)
+        label = metrics.host_label(host)
+        breaker = self._get_breaker(host)
+        if not breaker.allow():
+            metrics.webhook_deliveries_total.inc(host=label, result='circuit_open')
+            return DeliveryFailure('Circuit open for {}'.format(host), retryable=True)
+
+        limiter = self._get_limiter(host)
+        if limiter:
+            limiter.acquire()
+
+        started = time.perf_counter()
+        try:
+            response = self._get_session(host).post(url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            failure = None
+        except requests.HTTPError as e:
+            status = e.response.status_code
+            # Other client errors would fail the same way on every retry
+            failure = DeliveryFailure(str(e), retryable=status >= 500 or status in (408, 429))
+        except Exception as e:
+            failure = DeliveryFailure(str(e) or type(e).__name__, retryable=True)
+        elapsed = time.perf_counter() - started
+        metrics.webhook_delivery_seconds.observe(elapsed, host=label)
+        metrics.stage_seconds.observe(elapsed, stage='webhook_delivery')
+
+        if failure is None:
+            breaker.succeeded()
+            metrics.webhook_deliveries_total.inc(host=label, result='success')
+        else:
+            logger.warning('Event notification failed -- %s: %s', url, failure.error)
+            if failure.retryable:
+                breaker.failed()
+            else:
+                breaker.succeeded()
+            metrics.webhook_deliveries_total.inc(host=label, result='failure')
+        return failure
+
+    def deliver(self, notifications):
+        """
+        Sends the (url, payload) notifications concurrently and blocks until
+        all of them are done. Returns the failure of every notification, None
+        for those delivered.
+        """
+        futures = [self.executor.submit(self.post, url, payload) for url, payload in notifications]
+        return [future.result() for future in futures]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_delivery_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = WebhookDeliveryEngine(
+                    max_workers=getattr(settings, 'WOT_WEBHOOK_MAX_WORKERS', 20),
+                    pool_size=getattr(settings, 'WOT_WEBHOOK_POOL_SIZE', 10),
+                    timeout=getattr(settings, 'WOT_WEBHOOK_TIMEOUT', 10),
+                    rate_limit=getattr(settings, 'WOT_WEBHOOK_RATE_LIMIT', None),
+                    rate_burst=getattr(settings, 'WOT_WEBHOOK_RATE_BURST', 1),
+                    breaker_threshold=getattr(settings, 'WOT_WEBHOOK_BREAKER_THRESHOLD', 5),
+                    breaker_cooldown=getattr(settings, 'WOT_WEBHOOK_BREAKER_COOLDOWN', 30))
+    return _engine
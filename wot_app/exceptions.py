@@ -1,2 +1,5 @@
 class InvalidResourceDataException(Exception):
-    pass
\ No newline at end of file
+
+    def __init__(self, errors=None):
+        super().__init__(errors)
+        self.errors = errors or []
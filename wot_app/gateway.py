@@ -0,0 +1,275 @@
+"""
+Asynchronous ingestion gateway.
+
+An ASGI application that serves the resource data write endpoint,
+POST /api/<app-slug>/resources/<res-slug>/, with the same contract as the
+WSGI API: the same bearer tokens, the same payloads and body formats, and
+the same status codes and validation errors. Requests are authenticated and
+validated on arrival, and the accepted samples of all concurrent requests are
+written together in a single insert, either when the batch is full or shortly
+after its first sample arrived. A request is answered once its samples are
+committed, or queued in write-behind mode (see wot_app.writebehind).
+
+Serve it next to the WSGI application and route the write traffic to it:
+
+    uvicorn tow.asgi_ingest:application --port 8001
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from wot_app import writebehind
+from wot_app.api.codecs import RequestBodyTooLarge, UnsupportedMediaType, decode_body
+from wot_app.exceptions import InvalidResourceDataException
+from wot_app.ingest import validate_resource_data_batch, write_resource_data_batch
+from wot_app.lookups import get_access_token, get_application, get_resource
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_PATH = re.compile(r'^/api/(?P<app_slug>[\w-]+)/resources/(?P<res_slug>[\w-]+)/?$')
+
+
+class LookupMemo:
+    """
+    Keeps the tokens, applications and resources looked up from the cache in
+    the process for a few seconds, so that the event loop does not wait on a
+    cache round trip for every request. Changes reach the gateway at most
+    that many seconds late.
+    """
+
+    def __init__(self, timeout, max_entries=10000):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._entries = {}
+
+    async def get(self, key, lookup, *args):
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        value = await asyncio.get_running_loop().run_in_executor(None, lookup, *args)
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = (value, now + self.timeout)
+        return value
+
+
+class IngestBatcher:
+    """
+    Collects the validated samples of concurrent requests and writes them with
+    one insert when max_batch samples are pending or max_delay seconds after
+    the first of them arrived, whichever comes first. Inserts run on a small
+    thread pool so that the event loop keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, max_batch, max_delay, writers):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._executor = ThreadPoolExecutor(max_workers=writers, thread_name_prefix='wot-ingest')
+        self._pending = []
+        self._size = 0
+        self._timer = None
+
+    def submit(self, resource, samples):
+        """
+        Queues the samples of the resource and returns a future that is done
+        once they are committed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((resource, samples, future))
+        self._size += len(samples)
+
+        if self._size >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self.flush)
+        return future
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        pending, self._pending, self._size = self._pending, [], 0
+        resources = {}
+        samples_by_resource = {}
+        for resource, samples, _ in pending:
+            resource = resources.setdefault(resource.id, resource)
+            samples_by_resource.setdefault(resource, []).extend(samples)
+
+        write = asyncio.get_running_loop().run_in_executor(self._executor, self._write, samples_by_resource)
+        write.add_done_callback(lambda write: self._resolve(write, pending))
+
+    @staticmethod
+    def _write(samples_by_resource):
+        if writebehind.is_enabled():
+            writebehind.enqueue_resource_data_batch(samples_by_resource)
+            return
+        close_old_connections()
+        write_resource_data_batch(samples_by_resource, validate=False)
+
+    @staticmethod
+    def _resolve(write, pending):
+        error = write.exception()
+        if error is not None:
+            logger.error('Ingestion batch of %s requests failed', len(pending), exc_info=error)
+
+        for _, _, future in pending:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        """
+        Waits for the inserts in progress, flush the pending samples before.
+        """
+        self._executor.shutdown(wait=True)
+
+
+class IngestGateway:
+
+    def __init__(self):
+        self.max_body = getattr(settings, 'WOT_GATEWAY_MAX_BODY', 1024 * 1024)
+        self.memo = LookupMemo(getattr(settings, 'WOT_GATEWAY_MEMO_TIMEOUT', 5))
+        self._batcher = None
+
+    @property
+    def batcher(self):
+        if self._batcher is None:
+            self._batcher = IngestBatcher(
+                max_batch=getattr(settings, 'WOT_GATEWAY_MAX_BATCH', 1000),
+                max_delay=getattr(settings, 'WOT_GATEWAY_MAX_DELAY', 0.02),
+                writers=getattr(settings, 'WOT_GATEWAY_WRITERS', 2))
+        return self._batcher
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            status, body = await self._handle(scope, receive)
+            await self._respond(send, status, body)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._batcher is not None:
+                    self._batcher.flush()
+                    await asyncio.get_running_loop().run_in_executor(None, self._batcher.close)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _handle(self, scope, receive):
+        match = RESOURCE_PATH.match(scope['path'])
+        if match is None:
+            return 404, None
+        if scope['method'] != 'POST':
+            return 405, None
+
+        application = await self.memo.get(('application', match.group('app_slug')),
+                                          get_application, match.group('app_slug'))
+        if application is None:
+            logger.warning('Application not found from slug')
+            return 400, None
+
+        token = self._bearer_token(scope)
+        access_token = await self.memo.get(('access-token', token), get_access_token, token)
+        if access_token is None or (application.is_private and application != access_token.application):
+            return 403, None
+
+        body = await self._read_body(receive)
+        if body is None:
+            return 413, None
+        try:
+            data = decode_body(body, self._header(scope, b'content-type'), self._header(scope, b'content-encoding'))
+        except UnsupportedMediaType:
+            return 415, None
+        except RequestBodyTooLarge:
+            return 413, None
+        except ValueError:
+            # Rejected by the validation below, as the WSGI API does
+            data = None
+
+        resource = await self.memo.get(('resource', application.id, match.group('res_slug')),
+                                       get_resource, application, match.group('res_slug'))
+        if resource is None:
+            return 404, None
+
+        try:
+            samples = await asyncio.get_running_loop().run_in_executor(None, self._validate, resource, data)
+        except InvalidResourceDataException as e:
+            logger.warning('Resource data does not conform to specified structure: %s', e.errors)
+            return 400, {'errors': e.errors}
+
+        if samples:
+            try:
+                await self.batcher.submit(resource, samples)
+            except Exception:
+                return 500, None
+        return (202 if writebehind.is_enabled() else 200), None
+
+    @staticmethod
+    def _validate(resource, data):
+        """
+        Validates the samples as ResourceApiView does, for the same errors.
+        Runs on the executor: validation is CPU bound and its timer may flush
+        the metrics to Redis.
+        """
+        if writebehind.is_enabled():
+            return resource.validate_data_batch(data if isinstance(data, list) else [data])
+        elif isinstance(data, list):
+            return validate_resource_data_batch({resource: data})[resource]
+        return [resource.validate_data(data)]
+
+    @staticmethod
+    def _header(scope, header):
+        for name, value in scope['headers']:
+            if name == header:
+                return value.decode('latin-1')
+        return None
+
+    def _bearer_token(self, scope):
+        value = self._header(scope, b'authorization')
+        if value is None:
+            return None
+        return value[7:] if value.startswith('Bearer ') else value
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    @staticmethod
+    async def _respond(send, status, body):
+        headers = []
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers.append((b'content-type', b'application/json'))
+        else:
+            body = b''
+        headers.append((b'content-length', str(len(body)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
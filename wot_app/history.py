@@ -0,0 +1,228 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from wot_app.models import ResourceData, ResourceDataRollup
+from wot_app.validators import numeric_fields
+
+RAW_CURSOR = 'd'
+ROLLUP_CURSOR = 'r'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Numbers, and numeric strings as data fields were stored before validation
+# coerced them, in the JSON of a sample
+NUMBER_PATTERN = r'^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+
+
+def parse_time(value):
+    if value is None:
+        return None
+
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError('Invalid time: {}'.format(value))
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.utc)
+    return parsed
+
+
+def encode_cursor(kind, created, pk):
+    raw = '{}|{}|{}'.format(kind, created.isoformat(), pk)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        kind, created, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        if kind not in (RAW_CURSOR, ROLLUP_CURSOR):
+            raise ValueError
+        return kind, parse_time(created), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+
+def add_sample_stats(field_stats, data, fields):
+    """
+    Accumulates min, max, sum and count of the numeric fields of a sample.
+    """
+    for field in fields:
+        try:
+            value = float(data[field])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        stats = field_stats.get(field)
+        if stats is None:
+            field_stats[field] = {'min': value, 'max': value, 'sum': value, 'count': 1}
+        else:
+            stats['min'] = min(stats['min'], value)
+            stats['max'] = max(stats['max'], value)
+            stats['sum'] += value
+            stats['count'] += 1
+
+
+def merge_stats(field_stats, other):
+    for field, other_stats in other.items():
+        stats = field_stats.get(field)
+        if stats is None:
+            field_stats[field] = dict(other_stats)
+        else:
+            stats['min'] = min(stats['min'], other_stats['min'])
+            stats['max'] = max(stats['max'], other_stats['max'])
+            stats['sum'] += other_stats['sum']
+            stats['count'] += other_stats['count']
+
+
+def summarize_stats(field_stats):
+    return {field: {'min': stats['min'], 'max': stats['max'], 'avg': stats['sum'] / stats['count']}
+            for field, stats in field_stats.items()}
+
+
+def _raw_start(resource, start=None):
+    # Samples before the rolled-up boundary only live in the rollups
+    if resource.rolled_up_until is not None and (start is None or start < resource.rolled_up_until):
+        return resource.rolled_up_until
+    return start
+
+
+def _raw_queryset(resource, start=None, end=None):
+    start = _raw_start(resource, start)
+    queryset = resource.all_data.all()
+    if start is not None:
+        queryset = queryset.filter(created__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created__lt=end)
+    return queryset
+
+
+def _rollup_queryset(resource, period, start=None, end=None):
+    boundary = resource.rolled_up_until
+    if boundary is None or (start is not None and start >= boundary):
+        return None
+
+    if end is None or end > boundary:
+        end = boundary
+
+    queryset = resource.rollups.filter(period=period, start__lt=end)
+    if start is not None:
+        queryset = queryset.filter(start__gte=start)
+    return queryset
+
+
+def _rollup_item(rollup):
+    return {
+        'data': {field: stats['sum'] / stats['count'] for field, stats in rollup.fields.items()},
+        'time': rollup.start,
+        'rollup': {
+            'period': rollup.period,
+            'count': rollup.count,
+            'fields': summarize_stats(rollup.fields),
+        }
+    }
+
+
+def query_resource_data(resource, start=None, end=None, cursor=None, limit=100):
+    """
+    Returns a page of the samples of the resource in [start, end) ordered by
+    time and the cursor of the next page, if any. Pages are fetched with keyset
+    pagination so that deep pages cost the same as the first one. The part of
+    the range that has been rolled up is served from the hourly rollups.
+    """
+    after = decode_cursor(cursor) if cursor is not None else None
+    rows = []
+
+    if after is None or after[0] == ROLLUP_CURSOR:
+        rollups = _rollup_queryset(resource, ResourceDataRollup.HOUR, start, end)
+        if rollups is not None:
+            if after is not None:
+                rollups = rollups.filter(Q(start__gt=after[1]) | Q(start=after[1], id__gt=after[2]))
+            rows.extend((ROLLUP_CURSOR, rollup.start, rollup.id, _rollup_item(rollup))
+                        for rollup in rollups.order_by('start', 'id')[:limit + 1])
+
+    if len(rows) <= limit:
+        queryset = _raw_queryset(resource, start, end)
+        if after is not None and after[0] == RAW_CURSOR:
+            queryset = queryset.filter(Q(created__gt=after[1]) | Q(created=after[1], id__gt=after[2]))
+        raw = queryset.order_by('created', 'id').values_list('id', 'created', 'data')[:limit + 1 - len(rows)]
+        rows.extend((RAW_CURSOR, created, pk, {'data': data, 'time': created}) for pk, created, data in raw)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        kind, created, pk, _ = rows[-1]
+        next_cursor = encode_cursor(kind, created, pk)
+
+    return [item for _, _, _, item in rows], next_cursor
+
+
+def _aggregate_raw_data(resource, start, end, bucket_seconds, fields):
+    """
+    Returns the (bucket start, count, field stats) of the raw samples of the
+    resource in [start, end), aggregated by the database in one query.
+    """
+    columns, field_params = [], []
+    for index, field in enumerate(fields):
+        columns.append('CASE WHEN data::json ->> %s ~ %s THEN (data::json ->> %s)::float8 END AS f{}'.format(index))
+        field_params.extend([field, NUMBER_PATTERN, field])
+    aggregates = ''.join(', min(f{0}), max(f{0}), sum(f{0}), count(f{0})'.format(index) for index in range(len(fields)))
+
+    sql = ('SELECT bucket, count(*){aggregates} FROM ('
+           'SELECT floor(extract(epoch FROM created) / %s)::bigint AS bucket{columns} '
+           'FROM {table} WHERE resource_id = %s AND created >= %s AND created < %s'
+           ') AS samples GROUP BY bucket ORDER BY bucket').format(
+        aggregates=aggregates, columns=''.join(', ' + column for column in columns),
+        table=ResourceData._meta.db_table)
+    params = [bucket_seconds] + field_params + [resource.id, _raw_start(resource, start), end]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            field_stats = {}
+            for index, field in enumerate(fields):
+                low, high, total, count = row[2 + index * 4:6 + index * 4]
+                if count:
+                    field_stats[field] = {'min': low, 'max': high, 'sum': total, 'count': count}
+            yield row[0] * bucket_seconds, row[1], field_stats
+
+
+def downsample_resource_data(resource, start, end, bucket_seconds):
+    """
+    Aggregates the samples of the resource in [start, end) into buckets of the
+    given width with count, min, max and avg of every numeric data field.
+    Rolled-up samples contribute through their hourly or daily rollups, so
+    buckets narrower than the rollup period are widened to it there. Raw
+    samples are aggregated by the database.
+    """
+    fields = numeric_fields(resource.data_fields)
+    buckets = OrderedDict()
+
+    def get_bucket(bucket_start):
+        bucket = buckets.get(bucket_start)
+        if bucket is None:
+            bucket = buckets[bucket_start] = {'count': 0, 'fields': {}}
+        return bucket
+
+    period = ResourceDataRollup.DAY if bucket_seconds % 86400 == 0 else ResourceDataRollup.HOUR
+    rollups = _rollup_queryset(resource, period, start, end)
+    if rollups is not None:
+        for rollup in rollups.order_by('start', 'id').iterator():
+            bucket = get_bucket(int((rollup.start - EPOCH).total_seconds() // bucket_seconds) * bucket_seconds)
+            bucket['count'] += rollup.count
+            merge_stats(bucket['fields'], rollup.fields)
+
+    for bucket_start, count, field_stats in _aggregate_raw_data(resource, start, end, bucket_seconds, fields):
+        bucket = get_bucket(bucket_start)
+        bucket['count'] += count
+        merge_stats(bucket['fields'], field_stats)
+
+    return [{
+        'time': EPOCH + timedelta(seconds=bucket_start),
+        'count': bucket['count'],
+        'fields': summarize_stats(bucket['fields']),
+    } for bucket_start, bucket in sorted(buckets.items())]
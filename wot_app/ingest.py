@@ -0,0 +1,96 @@
+import logging
+
+from django.db import connection, transaction
+
+from wot_app import metrics
+from wot_app.exceptions import InvalidResourceDataException
+from wot_app.models import ResourceData
+from wot_app.signals import resource_data_bulk_post_save
+
+logger = logging.getLogger(__name__)
+
+
+def write_resource_data(resource, samples):
+    """
+    Validates and persists a batch of samples for a single resource.
+    """
+    return write_resource_data_batch({resource: samples})[resource]
+
+
+def validate_resource_data_batch(samples_by_resource):
+    """
+    Validates samples of one or more resources and returns them coerced to
+    the data fields of their resources. Raises InvalidResourceDataException
+    with the errors of all the samples, tagged with their resource.
+    """
+    validated = {}
+    errors = []
+    for resource, samples in samples_by_resource.items():
+        try:
+            validated[resource] = resource.validate_data_batch(samples)
+        except InvalidResourceDataException as e:
+            errors.extend(dict(error, resource=resource.slug) for error in e.errors)
+
+    if errors:
+        raise InvalidResourceDataException(errors)
+    return validated
+
+
+def _reserve_ids(count):
+    """
+    Takes count ids from the id sequence of ResourceData. bulk_create does not
+    set the ids of the rows it inserts, and the published samples need them
+    for the streams to resume from.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                       [ResourceData._meta.db_table, 'id', count])
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def _set_created(rows, times):
+    """
+    Sets the creation time of inserted rows with one update. bulk_create
+    stamps every row with the time of the insert.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE {} AS rd SET created = v.created FROM (VALUES {}) AS v (id, created) '
+                       'WHERE rd.id = v.id'.format(ResourceData._meta.db_table,
+                                                   ', '.join(['(%s, %s::timestamptz)'] * len(rows))),
+                       [value for row, time in zip(rows, times) for value in (row.id, time)])
+    for row, time in zip(rows, times):
+        row.created = time
+
+
+def write_resource_data_batch(samples_by_resource, validate=True, created_by_resource=None):
+    """
+    Validates and persists samples of one or more resources with a single
+    insert. The whole batch is rejected if any of the samples is invalid.
+    Events are evaluated once per resource for the inserted batch. Callers
+    that have already validated the samples pass validate=False, and callers
+    that received them earlier pass their times in created_by_resource, in
+    the order of the samples.
+    """
+    if validate:
+        samples_by_resource = validate_resource_data_batch(samples_by_resource)
+
+    rows = [ResourceData(resource=resource, data=data)
+            for resource, samples in samples_by_resource.items() for data in samples]
+    with metrics.stage_seconds.time(stage='insert'), transaction.atomic():
+        for resource_data, reserved_id in zip(rows, _reserve_ids(len(rows))):
+            resource_data.id = reserved_id
+        rows = ResourceData.objects.bulk_create(rows)
+        if created_by_resource is not None and rows:
+            _set_created(rows, [time for resource in samples_by_resource for time in created_by_resource[resource]])
+    metrics.resource_data_written_total.inc(len(rows))
+
+    written = {resource: [] for resource in samples_by_resource}
+    for resource_data in rows:
+        written[resource_data.resource].append(resource_data)
+
+    for resource, instances in written.items():
+        if instances:
+            resource_data_bulk_post_save.send(sender=ResourceData, resource=resource, instances=instances)
+
+    logger.info('Wrote %s resource data rows for %s resources', len(rows), len(written))
+    return written
@@ -0,0 +1,100 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from wot_app.models import Application, Resource
+
+ACCESS_TOKEN_KEY = 'wot:access-token:{}'
+APPLICATION_KEY = 'wot:application:{}'
+RESOURCE_KEY = 'wot:resource:{}:{}'
+
+# Cached in place of objects that do not exist, so that unknown tokens and
+# slugs do not reach the database on every request either
+MISSING = 'missing'
+
+
+def _timeout():
+    return getattr(settings, 'WOT_LOOKUP_CACHE_TIMEOUT', 300)
+
+
+def _access_token_key(token):
+    return ACCESS_TOKEN_KEY.format(hashlib.sha1(token.encode()).hexdigest())
+
+
+def get_access_token(token):
+    """
+    Returns the unexpired access token with its application and user, cached
+    for a while but never beyond the expiry of the token. Returns None if the
+    token does not exist or has expired.
+    """
+    if not token:
+        return None
+
+    key = _access_token_key(token)
+    access_token = cache.get(key)
+    if access_token is None:
+        try:
+            access_token = AccessToken.objects.select_related('application', 'user').get(token=token)
+        except AccessToken.DoesNotExist:
+            cache.set(key, MISSING, timeout=_timeout())
+            return None
+
+        if not access_token.is_expired():
+            ttl = (access_token.expires - timezone.now()).total_seconds()
+            cache.set(key, access_token, timeout=max(1, min(_timeout(), int(ttl))))
+
+    if access_token == MISSING or access_token.is_expired():
+        return None
+    return access_token
+
+
+def invalidate_access_token(token):
+    cache.delete(_access_token_key(token))
+
+
+def get_application(slug):
+    """
+    Returns the application of the slug from the cache or the database,
+    None if there is no such application.
+    """
+    if not slug:
+        return None
+
+    key = APPLICATION_KEY.format(slug)
+    application = cache.get(key)
+    if application is None:
+        try:
+            application = Application.objects.get(slug=slug)
+        except Application.DoesNotExist:
+            application = MISSING
+        cache.set(key, application, timeout=_timeout())
+
+    return None if application == MISSING else application
+
+
+def invalidate_application(slug):
+    cache.delete(APPLICATION_KEY.format(slug))
+
+
+def get_resource(application, slug):
+    """
+    Returns the resource of the application with the slug from the cache or
+    the database, None if there is no such resource.
+    """
+    key = RESOURCE_KEY.format(application.id, slug)
+    resource = cache.get(key)
+    if resource is None:
+        try:
+            resource = Resource.objects.get(slug=slug, application=application)
+        except Resource.DoesNotExist:
+            resource = MISSING
+        cache.set(key, resource, timeout=_timeout())
+
+    return None if resource == MISSING else resource
+
+
+def invalidate_resource(resource):
+    cache.delete(RESOURCE_KEY.format(resource.application_id, resource.slug))
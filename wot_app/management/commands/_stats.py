@@ -0,0 +1,5 @@
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))]
@@ -0,0 +1,66 @@
+import gzip
+import json
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wot_app.api.codecs import CODECS, decode_body, encode_body
+
+
+def stdlib_json_loads(body):
+    """
+    Request parsing as JsonRequestResponseMixin.get_request_json does it.
+    """
+    return json.loads(body.decode('utf-8'))
+
+
+class Command(BaseCommand):
+    help = ('Compares payload size and encoding and parsing cost of resource data in JSON, MessagePack and CBOR, '
+            'plain and gzipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help='Samples in a batch write')
+        parser.add_argument('--page', type=int, default=1000, help='Samples in a history page')
+        parser.add_argument('--number', type=int, default=1000, help='Runs per measurement')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        def sample(i):
+            return {'temperature': round(random.uniform(-20, 40), 2), 'humidity': random.randint(0, 100),
+                    'battery': random.randint(0, 100), 'sensor': 'sensor-{}'.format(i % 16)}
+
+        # Name, payload, samples in it, whether it is a request body
+        payloads = [
+            ('single sample write', sample(0), 1, True),
+            ('batch write of {}'.format(options['batch']), [sample(i) for i in range(options['batch'])],
+             options['batch'], True),
+            ('history page of {}'.format(options['page']), {
+                'data': [{'id': i, 'data': sample(i), 'time': now} for i in range(options['page'])], 'next': None},
+             options['page'], False),
+        ]
+
+        if len(CODECS) == 1:
+            self.stdout.write('Install msgpack and cbor2 to compare them with JSON')
+
+        for name, payload, samples, is_request in payloads:
+            self.stdout.write(name)
+            number = max(1, options['number'] // samples)
+            for media_type in sorted(CODECS):
+                body = encode_body(payload, media_type)
+                compressed = gzip.compress(body)
+                encode_time = timeit.timeit(lambda: encode_body(payload, media_type), number=number) / number
+                decode_time = timeit.timeit(lambda: decode_body(body, media_type), number=number) / number
+                gzip_time = timeit.timeit(lambda: decode_body(compressed, media_type, 'gzip'), number=number) / number
+                self.stdout.write('  {:<20} {:>8} bytes {:>8} gzipped  encode {:>9.2f} us  decode {:>9.2f} us  '
+                                  'gunzip+decode {:>9.2f} us'.format(media_type, len(body), len(compressed),
+                                                                     encode_time * 1e6, decode_time * 1e6,
+                                                                     gzip_time * 1e6))
+
+            if is_request:
+                body = json.dumps(payload).encode()
+                decode_time = timeit.timeit(lambda: stdlib_json_loads(body), number=number) / number
+                self.stdout.write('  {:<20} {:>8} bytes {:>16}  {:>15}  decode {:>9.2f} us'.format(
+                    'json (before)', len(body), '', '', decode_time * 1e6))
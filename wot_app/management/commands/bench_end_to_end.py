@@ -0,0 +1,219 @@
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from tow.celery import app as celery_app
+from wot_app.management.commands._stats import percentile
+from wot_app.models import (Application, Resource, ResourceData, ResourceDataRollup, Event, EventSubscription,
+                            UndeliveredNotification)
+
+DATA_FIELDS = {'seq': 'int', 'value': 'float'}
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NotificationSink:
+    """
+    Local HTTP server in front of the Django application, so that webhooks
+    reach notification_endpoint, recording when the notification of every
+    sample is received.
+    """
+
+    def __init__(self):
+        self.received = {}
+        self.lock = threading.Lock()
+        self.server = make_server('127.0.0.1', 0, self._application, server_class=ThreadingWSGIServer,
+                                  handler_class=QuietRequestHandler)
+        self.handler = WSGIHandler()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/hook'.format(self.server.server_port)
+
+    @property
+    def count(self):
+        with self.lock:
+            return sum(len(times) for times in self.received.values())
+
+    def _application(self, environ, start_response):
+        if environ['PATH_INFO'].startswith('/hook'):
+            body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+            self._record(body, time.perf_counter())
+            environ['wsgi.input'] = io.BytesIO(body)
+        return self.handler(environ, start_response)
+
+    def _record(self, body, received):
+        payload = json.loads(body.decode())
+        with self.lock:
+            for event_data in payload if isinstance(payload, list) else [payload]:
+                self.received.setdefault(event_data['resource']['data']['seq'], []).append(received)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class Command(BaseCommand):
+    help = ('Provisions applications with resources, events and subscriptions, posts resource data through the API '
+            'and reports write throughput and the latency from posting a sample to receiving its notifications')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--applications', type=int, default=2)
+        parser.add_argument('--resources', type=int, default=5, help='Resources per application')
+        parser.add_argument('--events', type=int, default=2, help='Events per resource')
+        parser.add_argument('--subscriptions', type=int, default=1, help='Subscriptions per event')
+        parser.add_argument('--samples', type=int, default=1000, help='Samples to post in total')
+        parser.add_argument('--batch', type=int, default=1, help='Samples per request, 1 posts single objects')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--eager', action='store_true',
+                            help='Run the Celery tasks in the posting process instead of a running worker')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for the notifications')
+        parser.add_argument('--keep', action='store_true', help='Keep the provisioned objects')
+
+    def handle(self, *args, **options):
+        if options['eager']:
+            celery_app.conf.CELERY_ALWAYS_EAGER = True
+
+        sink = NotificationSink()
+        sink.start()
+        applications = []
+        try:
+            targets = self._provision(options, sink.url, applications)
+            sent, latencies, elapsed, errors = self._post(targets, options)
+
+            expected = len(sent) * options['events'] * options['subscriptions']
+            deadline = time.perf_counter() + options['timeout']
+            while sink.count < expected and time.perf_counter() < deadline:
+                time.sleep(0.1)
+
+            self._report(sent, latencies, elapsed, errors, sink, expected)
+        finally:
+            sink.stop()
+            if not options['keep']:
+                self._clean_up(applications, sink.url)
+
+    def _provision(self, options, notify_url, applications):
+        run = uuid.uuid4().hex[:8]
+        user, _ = User.objects.get_or_create(username='wot-bench')
+        targets = []
+        for a in range(options['applications']):
+            application = Application.objects.create(
+                name='bench-{}-{}'.format(run, a), user=user,
+                client_type=Application.CLIENT_CONFIDENTIAL,
+                authorization_grant_type=Application.GRANT_CLIENT_CREDENTIALS)
+            applications.append(application)
+            token = AccessToken.objects.create(user=user, application=application, token=uuid.uuid4().hex,
+                                               expires=timezone.now() + timedelta(days=1), scope='read write')
+
+            for r in range(options['resources']):
+                resource = Resource.objects.create(name='bench-{}-{}-{}'.format(run, a, r), application=application,
+                                                   data_fields=DATA_FIELDS)
+                targets.append((resource.url, token.token))
+
+                for e in range(options['events']):
+                    event = Event.objects.create(name='bench-{}-{}-{}-{}'.format(run, a, r, e),
+                                                 application=application, resource=resource,
+                                                 condition=[['seq', 'ge', 0]])
+                    for _ in range(options['subscriptions']):
+                        EventSubscription.objects.create(event=event, notify_url=notify_url)
+
+        self.stdout.write('Provisioned {} applications, {} resources, {} events, {} subscriptions'.format(
+            options['applications'], len(targets), len(targets) * options['events'],
+            len(targets) * options['events'] * options['subscriptions']))
+        return targets
+
+    def _post(self, targets, options):
+        sent = {}
+        latencies = []
+        errors = [0]
+        requests = iter(range(0, options['samples'], options['batch']))
+        lock = threading.Lock()
+
+        def client():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        first = next(requests, None)
+                    if first is None:
+                        return
+
+                    url, token = targets[(first // options['batch']) % len(targets)]
+                    samples = [{'seq': seq, 'value': random.uniform(0, 100)}
+                               for seq in range(first, min(first + options['batch'], options['samples']))]
+                    body = json.dumps(samples if options['batch'] > 1 else samples[0])
+
+                    started = time.perf_counter()
+                    response = client.post(url, body, content_type='application/json',
+                                           HTTP_AUTHORIZATION='Bearer {}'.format(token))
+                    latency = time.perf_counter() - started
+
+                    with lock:
+                        if response.status_code in (200, 202):
+                            latencies.append(latency)
+                            sent.update((sample['seq'], started) for sample in samples)
+                        else:
+                            errors[0] += 1
+            finally:
+                connection.close()
+
+        clients = [threading.Thread(target=client) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return sent, latencies, time.perf_counter() - started, errors[0]
+
+    def _report(self, sent, latencies, elapsed, errors, sink, expected):
+        latencies.sort()
+        self.stdout.write('Posted {} samples in {:.2f}s: {:.1f} samples/s, {} failed requests'.format(
+            len(sent), elapsed, len(sent) / elapsed, errors))
+        if latencies:
+            self.stdout.write('POST latency    p50 {:8.2f} ms  p95 {:8.2f} ms  p99 {:8.2f} ms'.format(
+                *(percentile(latencies, fraction) * 1000 for fraction in (0.5, 0.95, 0.99))))
+
+        with sink.lock:
+            receipts = [(sent[seq], received)
+                        for seq, times in sink.received.items() if seq in sent for received in times]
+        end_to_end = sorted(received - posted for posted, received in receipts)
+        self.stdout.write('Received {} of {} notifications'.format(len(end_to_end), expected))
+        if end_to_end:
+            span = max(received for _, received in receipts) - min(posted for posted, _ in receipts)
+            self.stdout.write('Notified {:.1f} notifications/s over {:.2f}s'.format(len(end_to_end) / span, span))
+            self.stdout.write('POST to webhook p50 {:8.2f} ms  p95 {:8.2f} ms  p99 {:8.2f} ms'.format(
+                *(percentile(end_to_end, fraction) * 1000 for fraction in (0.5, 0.95, 0.99))))
+
+    def _clean_up(self, applications, notify_url):
+        # Resource data, events and subscriptions are not deleted along with their parents
+        EventSubscription.objects.filter(event__application__in=applications).delete()
+        Event.objects.filter(application__in=applications).delete()
+        ResourceData.objects.filter(resource__application__in=applications).delete()
+        ResourceDataRollup.objects.filter(resource__application__in=applications).delete()
+        UndeliveredNotification.objects.filter(notify_url=notify_url).delete()
+        for application in applications:
+            application.delete()
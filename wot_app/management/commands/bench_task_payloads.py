@@ -0,0 +1,41 @@
+import json
+import pickle
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wot_app.definitions import resource_data_payload
+from wot_app.models import Application, Resource, Event, ResourceData
+
+
+class Command(BaseCommand):
+    help = 'Compares size and serialization cost of pickled model task arguments with compact JSON payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=10000, help='Serializations per measurement')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        now = timezone.now()
+
+        application = Application(id=1, name='first-app', slug='first-app', client_type=Application.CLIENT_PUBLIC,
+                                  authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE, created=now,
+                                  modified=now)
+        resource = Resource(id=1, name='light', slug='light', application=application, created=now, modified=now,
+                            data_fields={'illuminance': 'float', 'lamp': 'str'})
+        event = Event(id=1, name='too-bright', slug='too-bright', resource=resource, application=application,
+                      condition=[['illuminance', 'gt', 50]], created=now, modified=now)
+        resource_data = ResourceData(id=1, resource=resource, data={'illuminance': 73.5, 'lamp': 'kitchen'},
+                                     created=now, modified=now)
+
+        cases = [
+            ('pickled instances', (event, resource_data), pickle.dumps, pickle.loads),
+            ('json ids + sample', (event.id, resource_data_payload(resource_data)), json.dumps, json.loads),
+        ]
+        for name, task_args, dumps, loads in cases:
+            message = dumps(task_args)
+            dump_time = timeit.timeit(lambda: dumps(task_args), number=number) / number
+            load_time = timeit.timeit(lambda: loads(message), number=number) / number
+            self.stdout.write('{:<20} {:>6} bytes  dumps {:>8.2f} us  loads {:>8.2f} us'.format(
+                name, len(message), dump_time * 1e6, load_time * 1e6))
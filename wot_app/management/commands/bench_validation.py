@@ -0,0 +1,68 @@
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from wot_app.exceptions import InvalidResourceDataException
+from wot_app.validators import ResourceDataValidator
+
+DATA_FIELDS = {
+    'temperature': 'float',
+    'humidity': {'type': 'float', 'min': 0, 'max': 100},
+    'battery': 'int',
+    'sensor': 'str',
+}
+
+
+def legacy_validate_data(data_fields, resource_data):
+    """
+    Resource.validate_data as it was before the validators were compiled.
+    """
+    extra_fields = set(resource_data.keys()).difference(data_fields.keys())
+    if extra_fields:
+        raise InvalidResourceDataException
+
+    for k, val in resource_data.items():
+        expected_type = data_fields[k]
+        if isinstance(expected_type, dict):
+            expected_type = expected_type['type']
+        if type(val).__name__ != expected_type:
+            if expected_type == 'float':
+                try:
+                    float(val)
+                except ValueError:
+                    raise InvalidResourceDataException
+            else:
+                raise InvalidResourceDataException
+
+
+class Command(BaseCommand):
+    help = 'Measures per-sample cost of resource data validation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=10000, help='Samples per batch')
+        parser.add_argument('--repeat', type=int, default=5, help='Measurements, the best one is reported')
+
+    def handle(self, *args, **options):
+        samples = [{
+            'temperature': random.uniform(-20, 40),
+            'humidity': random.randint(0, 100),
+            'battery': random.randint(0, 100),
+            'sensor': 'sensor-{}'.format(i % 16),
+        } for i in range(options['samples'])]
+
+        def legacy():
+            for data in samples:
+                legacy_validate_data(DATA_FIELDS, data)
+
+        def compiled():
+            validator = ResourceDataValidator(DATA_FIELDS)
+            for data in samples:
+                validator.validate(data)
+
+        def compiled_batch():
+            ResourceDataValidator(DATA_FIELDS).validate_batch(samples)
+
+        for name, func in [('legacy', legacy), ('compiled', compiled), ('compiled batch', compiled_batch)]:
+            best = min(timeit.repeat(func, number=1, repeat=options['repeat']))
+            self.stdout.write('{:<16} {:>8.3f} us/sample'.format(name, best / len(samples) * 1e6))
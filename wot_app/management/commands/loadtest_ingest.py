@@ -0,0 +1,79 @@
+import json
+import threading
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from wot_app.management.commands._stats import percentile
+
+
+class Command(BaseCommand):
+    help = ('Posts resource data to one or more write endpoints concurrently and reports the throughput and '
+            'latency of each, e.g. the WSGI API against the ingestion gateway')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Resource URLs to post to')
+        parser.add_argument('--token', required=True, help='Access token of the application')
+        parser.add_argument('--data', default='{}', help='Sample to post, as JSON')
+        parser.add_argument('--batch', type=int, default=1, help='Samples per request, 1 posts single objects')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per URL')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent clients')
+
+    def handle(self, *args, **options):
+        try:
+            sample = json.loads(options['data'])
+        except ValueError:
+            raise CommandError('--data should be JSON')
+
+        body = json.dumps(sample if options['batch'] == 1 else [sample] * options['batch'])
+        headers = {'Authorization': 'Bearer {}'.format(options['token']), 'Content-Type': 'application/json'}
+
+        self.stdout.write('{:<60} {:>10} {:>12} {:>8} {:>8} {:>8} {:>7}'.format(
+            'url', 'req/s', 'samples/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+        for url in options['urls']:
+            latencies, errors, elapsed = self._run(url, body, headers, options['requests'], options['concurrency'])
+            latencies.sort()
+            self.stdout.write('{:<60} {:>10.1f} {:>12.1f} {:>8.2f} {:>8.2f} {:>8.2f} {:>7}'.format(
+                url,
+                len(latencies) / elapsed,
+                len(latencies) * options['batch'] / elapsed,
+                percentile(latencies, 0.50) * 1000 if latencies else 0,
+                percentile(latencies, 0.95) * 1000 if latencies else 0,
+                percentile(latencies, 0.99) * 1000 if latencies else 0,
+                errors))
+
+    def _run(self, url, body, headers, total, concurrency):
+        latencies = []
+        errors = [0]
+        remaining = [total]
+        lock = threading.Lock()
+
+        def client():
+            session = requests.Session()
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+
+                started = time.perf_counter()
+                try:
+                    ok = session.post(url, data=body, headers=headers).status_code // 100 == 2
+                except requests.RequestException:
+                    ok = False
+                latency = time.perf_counter() - started
+
+                with lock:
+                    if ok:
+                        latencies.append(latency)
+                    else:
+                        errors[0] += 1
+
+        clients = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return latencies, errors[0], time.perf_counter() - started
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from wot_app.delivery import get_delivery_engine
+from wot_app.models import UndeliveredNotification
+
+
+class Command(BaseCommand):
+    help = 'Delivers the webhook notifications that were given up, oldest first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Undelivered notifications to replay, all by default')
+        parser.add_argument('--url', help='Replay only the notifications of notify URLs that contain this')
+        parser.add_argument('--limit', type=int, help='Replay at most this many notifications')
+        parser.add_argument('--batch', type=int, default=100, help='Notifications delivered concurrently')
+
+    def handle(self, *args, **options):
+        queryset = UndeliveredNotification.objects.order_by('id')
+        if options['ids']:
+            queryset = queryset.filter(id__in=options['ids'])
+        if options['url']:
+            queryset = queryset.filter(notify_url__contains=options['url'])
+
+        engine = get_delivery_engine()
+        delivered = failed = 0
+        last_id = 0
+        remaining = options['limit']
+        while remaining is None or remaining > 0:
+            size = options['batch'] if remaining is None else min(options['batch'], remaining)
+            notifications = list(queryset.filter(id__gt=last_id)[:size])
+            if not notifications:
+                break
+            last_id = notifications[-1].id
+            if remaining is not None:
+                remaining -= len(notifications)
+
+            failures = engine.deliver([(notification.notify_url, notification.payload)
+                                       for notification in notifications])
+            for notification, failure in zip(notifications, failures):
+                if failure is None:
+                    notification.delete()
+                    delivered += 1
+                else:
+                    notification.attempts += 1
+                    notification.error = failure.error[:255]
+                    notification.save(update_fields=['attempts', 'error', 'modified'])
+                    failed += 1
+
+        self.stdout.write('Delivered {} notifications, {} failed again'.format(delivered, failed))
@@ -0,0 +1,36 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from wot_app.writebehind import get_queue, flush_write_behind_queue
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Flushes the write-behind queue of this host into the database in group commits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=0.05, help='Seconds between checks of the queue')
+
+    def handle(self, *args, **options):
+        max_batch = getattr(settings, 'WOT_WRITE_BEHIND_MAX_BATCH', 5000)
+        max_delay = getattr(settings, 'WOT_WRITE_BEHIND_MAX_DELAY', 1.0)
+        queue = get_queue()
+
+        self.stdout.write('Flushing {} in batches of up to {} samples'.format(queue.path, max_batch))
+        while True:
+            try:
+                count, age = queue.backlog()
+                if count >= max_batch or (count and age >= max_delay):
+                    close_old_connections()
+                    flush_write_behind_queue(max_batch)
+                    continue
+            except Exception:
+                logger.exception('Flushing the write-behind queue failed, retrying')
+                close_old_connections()
+                time.sleep(1)
+            time.sleep(options['poll'])
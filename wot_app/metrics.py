@@ -0,0 +1,305 @@
+"""
+Counters, histograms and gauges in the Prometheus text format.
+
+Observations are accumulated in the process and added to a Redis hash every
+WOT_METRICS_FLUSH_INTERVAL seconds, so that the API processes and the Celery
+workers report together and an observation costs a few dict updates. Every
+sample is a field of the hash named after its Prometheus sample line, e.g.
+wot_webhook_deliveries_total{host="example.com",result="success"}. Histogram
+buckets are stored per bucket and made cumulative when rendered.
+
+Per-host series are bounded: past WOT_METRICS_MAX_HOSTS distinct hosts, the
+further ones are reported together under the host label "other".
+"""
+import atexit
+import logging
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+import redis
+from django.conf import settings
+
+from wot_app.pubsub import get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'wot:metrics'
+METRICS_HOSTS_KEY = 'wot:metrics:hosts'
+
+OTHER_HOST = 'other'
+
+# Adds the host to the reported ones unless there are enough already
+ADMIT_HOST_SCRIPT = """
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    return 1
+end
+if redis.call('SCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('SADD', KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics = []
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = [time.monotonic()]
+_host_labels = {}
+_admit_host = None
+
+
+def _flush_interval():
+    return getattr(settings, 'WOT_METRICS_FLUSH_INTERVAL', 5)
+
+
+def _max_hosts():
+    return getattr(settings, 'WOT_METRICS_MAX_HOSTS', 100)
+
+
+def url_host(url):
+    """
+    Returns the host of a URL with its port if one is given, leaving out any
+    credentials in it.
+    """
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    if ':' in host:
+        host = '[{}]'.format(host)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    return '{}:{}'.format(host, port) if port else host
+
+
+def host_label(host):
+    """
+    Returns the label the host is reported under: the host itself if it is
+    one of the first WOT_METRICS_MAX_HOSTS hosts seen by any process, "other"
+    otherwise.
+    """
+    global _admit_host
+    label = _host_labels.get(host)
+    if label is not None:
+        return label
+
+    try:
+        if _admit_host is None:
+            _admit_host = get_redis().register_script(ADMIT_HOST_SCRIPT)
+        admitted = _admit_host(keys=[METRICS_HOSTS_KEY], args=[host, _max_hosts()])
+    except Exception:
+        logger.exception('Admitting %s to the metrics failed', host)
+        return OTHER_HOST
+
+    if len(_host_labels) >= 4 * _max_hosts():
+        _host_labels.clear()
+    label = _host_labels[host] = host if admitted else OTHER_HOST
+    return label
+
+
+def _labels(labels):
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                    for name, value in labels)
+
+
+def _sample(name, labels):
+    return '{}{{{}}}'.format(name, labels) if labels else name
+
+
+def _add(samples):
+    with _pending_lock:
+        for sample, amount in samples:
+            _pending[sample] = _pending.get(sample, 0) + amount
+        due = time.monotonic() - _last_flush[0] >= _flush_interval()
+    if due:
+        flush()
+
+
+def flush():
+    """
+    Adds the observations of the process since the last flush to Redis.
+    """
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for sample, amount in pending.items():
+            pipeline.hincrbyfloat(METRICS_KEY, sample, amount)
+        pipeline.execute()
+    except Exception:
+        logger.exception('Flushing %s metric samples failed', len(pending))
+
+
+atexit.register(flush)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._label_strings = {}
+        _metrics.append(self)
+
+    def _label_string(self, labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        label_string = self._label_strings.get(key)
+        if label_string is None:
+            label_string = self._label_strings[key] = _labels(zip(self.labelnames, key))
+        return label_string
+
+    def render(self, samples):
+        return ['{} {}'.format(sample, repr(value)) for sample, value in sorted(samples.get(self.name, ()))]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _add(((_sample(self.name, self._label_string(labels)), amount),))
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._bounds = tuple(str(bound) for bound in self.buckets) + ('+Inf',)
+        self._series_samples = {}
+
+    def _series(self, labels):
+        label_string = self._label_string(labels)
+        series = self._series_samples.get(label_string)
+        if series is None:
+            series = self._series_samples[label_string] = (
+                tuple('{}_bucket{{{}le="{}"}}'.format(self.name, label_string + ',' if label_string else '', bound)
+                      for bound in self._bounds),
+                _sample(self.name + '_sum', label_string),
+                _sample(self.name + '_count', label_string))
+        return series
+
+    def observe(self, value, **labels):
+        buckets, sum_sample, count_sample = self._series(labels)
+        _add(((buckets[bisect_left(self.buckets, value)], 1), (sum_sample, value), (count_sample, 1)))
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self, samples):
+        buckets = {}
+        for sample, value in samples.get(self.name + '_bucket', ()):
+            labels, _, bound = sample[sample.index('{') + 1:-1].rpartition('le="')
+            buckets.setdefault(labels.rstrip(','), {})[bound[:-1]] = value
+        sums = dict(samples.get(self.name + '_sum', ()))
+
+        lines = []
+        for labels, counts in sorted(buckets.items()):
+            total = 0.0
+            for bound in self._bounds:
+                total += counts.get(bound, 0)
+                lines.append('{}_bucket{{{}le="{}"}} {}'.format(
+                    self.name, labels + ',' if labels else '', bound, repr(total)))
+            sum_sample = _sample(self.name + '_sum', labels)
+            lines.append('{} {}'.format(sum_sample, repr(sums.get(sum_sample, 0.0))))
+            lines.append('{} {}'.format(_sample(self.name + '_count', labels), repr(total)))
+        return lines
+
+
+class Gauge(Metric):
+    """
+    Value read when the metrics are rendered; collect returns (labels, value)
+    pairs.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, collect):
+        super().__init__(name, documentation)
+        self.collect = collect
+
+    def render(self, samples):
+        try:
+            values = self.collect()
+        except Exception:
+            logger.exception('Collecting %s failed', self.name)
+            return []
+        return ['{} {}'.format(_sample(self.name, _labels(sorted(labels.items()))), repr(float(value)))
+                for labels, value in values]
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def render_metrics():
+    """
+    Returns all the metrics reported by the processes in the Prometheus text
+    exposition format.
+    """
+    flush()
+    samples = {}
+    for sample, value in get_redis().hgetall(METRICS_KEY).items():
+        sample = sample.decode()
+        samples.setdefault(sample.split('{', 1)[0], []).append((sample, float(value)))
+
+    lines = []
+    for metric in _metrics:
+        lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+        lines.extend(metric.render(samples))
+    return '\n'.join(lines) + '\n'
+
+
+webhook_delivery_seconds = Histogram(
+    'wot_webhook_delivery_seconds', 'Time to deliver a webhook notification, including failed attempts', ['host'])
+webhook_deliveries_total = Counter(
+    'wot_webhook_deliveries_total', 'Webhook delivery attempts by result', ['host', 'result'])
+webhook_retries_total = Counter(
+    'wot_webhook_retries_total', 'Webhook deliveries scheduled for a retry', ['host'])
+webhook_dead_letters_total = Counter(
+    'wot_webhook_dead_letters_total', 'Webhook notifications given up and stored as undelivered', ['host'])
+
+stage_seconds = Histogram(
+    'wot_stage_seconds', 'Time spent in the stages of writing resource data and notifying its events', ['stage'])
+resource_data_written_total = Counter(
+    'wot_resource_data_written_total', 'Resource data samples inserted')
+event_occurrences_total = Counter(
+    'wot_event_occurrences_total', 'Events triggered by resource data')
+celery_task_lag_seconds = Histogram(
+    'wot_celery_task_lag_seconds', 'Time from publishing a task, or from its ETA, to a worker starting it', ['task'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+
+_broker = None
+
+
+def _celery_queue_depth():
+    global _broker
+    if _broker is None:
+        _broker = redis.StrictRedis.from_url(settings.BROKER_URL)
+    queues = getattr(settings, 'WOT_METRICS_CELERY_QUEUES', ('celery',))
+    return [({'queue': queue}, _broker.llen(queue)) for queue in queues]
+
+
+celery_queue_depth = Gauge(
+    'wot_celery_queue_depth', 'Tasks waiting in the Celery broker queues', _celery_queue_depth)
@@ -1,8 +1,17 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.http.response import HttpResponse
-from oauth2_provider.models import AccessToken
+from django.middleware.gzip import GZipMiddleware
+from wot_app import metrics, profiling
 from wot_app.decorators import filter_paths
-from wot_app.models import Application
+from wot_app.lookups import get_access_token, get_application
+import cProfile
 import logging
+import os
+import random
+import re
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -12,21 +21,100 @@ class OauthApplicationMiddleware:
 
     def process_view(self, request, view_callback, view_args, view_kwargs):
         app_slug = view_kwargs.get('app_slug')
-        try:
-            app = Application.objects.get(slug=app_slug)
-            request.application = app
-            logger.info("OauthApplicationMiddleware: %s(%s) -- %s", app.name, app.id, request.path)
-            return None
-        except Exception:
-            logger.exception("OauthApplicationMiddleware: Error occured for app %s -- %s", app_slug, request.path)
+        app = get_application(app_slug)
+        if app is None:
+            logger.error("OauthApplicationMiddleware: Application not found %s -- %s", app_slug, request.path)
             return HttpResponse(status=400)
 
+        request.application = app
+        logger.info("OauthApplicationMiddleware: %s(%s) -- %s", app.name, app.id, request.path)
+        return None
+
 
+@filter_paths(include=['/api/'])
 class OauthAccessTokenMiddleware:
 
     def process_request(self, request):
+        with metrics.stage_seconds.time(stage='auth'):
+            token = request.META.get('HTTP_AUTHORIZATION', '')
+            if token.startswith('Bearer '):
+                token = token[len('Bearer '):]
+            request.access_token = get_access_token(token)
+
+
+@filter_paths(include=['/api/'])
+class ProfilingMiddleware:
+    """
+    Reports the SQL queries, cache lookups and serialization of API requests
+    in a Server-Timing header, and dumps a cProfile of a sample of them into
+    WOT_PROFILING_DIR. Enabled by WOT_PROFILING, it should come first in
+    MIDDLEWARE_CLASSES so that the other middleware is accounted for.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'WOT_PROFILING', False):
+            raise MiddlewareNotUsed()
+
+        self.sample_rate = getattr(settings, 'WOT_PROFILING_SAMPLE_RATE', 0.01)
+        self.directory = getattr(settings, 'WOT_PROFILING_DIR', 'profiles')
+
+    def process_request(self, request):
+        request._profiled_queries = []
+        for connection in connections.all():
+            request._profiled_queries.append((connection, connection.force_debug_cursor, len(connection.queries_log)))
+            connection.force_debug_cursor = True
+
+        request._profile = profiling.start_profile()
+        request._cprofile = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            request._cprofile = cProfile.Profile()
+            request._cprofile.enable()
+
+    def process_response(self, request, response):
+        profile = profiling.stop_profile()
+        if profile is None or getattr(request, '_profile', None) is not profile:
+            return response
+
+        total = time.perf_counter() - profile.started
+        if request._cprofile is not None:
+            request._cprofile.disable()
+            self._dump(request, request._cprofile)
+
+        query_count = 0
+        query_time = 0.0
+        for connection, force_debug_cursor, logged in request._profiled_queries:
+            connection.force_debug_cursor = force_debug_cursor
+            # queries_log is a bounded deque, older queries may have been dropped
+            queries = list(connection.queries_log)[min(logged, len(connection.queries_log)):]
+            query_count += len(queries)
+            query_time += sum(float(query['time']) for query in queries)
+
+        response['Server-Timing'] = ', '.join([
+            'db;dur={:.2f};desc="{} queries"'.format(query_time * 1000, query_count),
+            'cache;dur={:.2f};desc="{} hits, {} misses"'.format(
+                profile.cache_time * 1000, profile.cache_hits, profile.cache_misses),
+            'serialize;dur={:.2f}'.format(profile.serialization_time * 1000),
+            'total;dur={:.2f}'.format(total * 1000),
+        ])
+        return response
+
+    def _dump(self, request, cprofile):
+        name = '{:.6f}-{}-{}.prof'.format(time.time(), request.method, re.sub(r'[^\w-]+', '_', request.path).strip('_'))
         try:
-            token = request.META.get('HTTP_AUTHORIZATION')
-            request.access_token = AccessToken.objects.get(token=token)
-        except Exception:
-            request.access_token = None
+            os.makedirs(self.directory, exist_ok=True)
+            cprofile.dump_stats(os.path.join(self.directory, name))
+        except OSError:
+            logger.exception("ProfilingMiddleware: Dumping the profile of %s failed", request.path)
+
+
+@filter_paths(include=['/api/'])
+class ApiGZipMiddleware(GZipMiddleware):
+    """
+    Compresses API responses for clients accepting gzip, except event streams,
+    whose events would be held back by the compressor.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        return super().process_response(request, response)
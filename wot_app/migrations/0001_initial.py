@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import autoslug.fields
+import django_extensions.db.fields
+import jsonfield.fields
+import oauth2_provider.generators
+import oauth2_provider.validators
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+TIMESTAMPED_OPTIONS = {
+    'ordering': ('-modified', '-created'),
+    'get_latest_by': 'modified',
+    'abstract': False,
+}
+
+
+def timestamps():
+    return [
+        ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+        ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Application',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+            ] + timestamps() + [
+                ('client_id', models.CharField(default=oauth2_provider.generators.generate_client_id, unique=True,
+                                               max_length=100, db_index=True)),
+                ('redirect_uris', models.TextField(help_text='Allowed URIs list, space separated', blank=True,
+                                                   validators=[oauth2_provider.validators.validate_uris])),
+                ('client_type', models.CharField(max_length=32, choices=[('confidential', 'Confidential'),
+                                                                         ('public', 'Public')])),
+                ('authorization_grant_type', models.CharField(max_length=32, choices=[
+                    ('authorization-code', 'Authorization code'), ('implicit', 'Implicit'),
+                    ('password', 'Resource owner password-based'), ('client-credentials', 'Client credentials')])),
+                ('client_secret', models.CharField(default=oauth2_provider.generators.generate_client_secret,
+                                                   max_length=255, db_index=True, blank=True)),
+                ('name', models.CharField(max_length=255, blank=True)),
+                ('skip_authorization', models.BooleanField(default=False)),
+                ('is_private', models.BooleanField(default=False)),
+                ('slug', autoslug.fields.AutoSlugField(populate_from='name', unique=True, editable=False)),
+                ('user', models.ForeignKey(related_name='wot_app_application', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Resource',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+            ] + timestamps() + [
+                ('name', models.CharField(max_length=100)),
+                ('data_fields', jsonfield.fields.JSONField()),
+                ('slug', autoslug.fields.AutoSlugField(populate_from='name', unique=True, editable=False)),
+                ('application', models.ForeignKey(related_name='resources', to='wot_app.Application')),
+            ],
+            options=TIMESTAMPED_OPTIONS,
+        ),
+        migrations.CreateModel(
+            name='ResourceData',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+            ] + timestamps() + [
+                ('data', jsonfield.fields.JSONField()),
+                ('resource', models.ForeignKey(related_name='all_data', on_delete=django.db.models.deletion.DO_NOTHING,
+                                               to='wot_app.Resource')),
+            ],
+            options=TIMESTAMPED_OPTIONS,
+        ),
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+            ] + timestamps() + [
+                ('name', models.CharField(max_length=100)),
+                ('condition', jsonfield.fields.JSONField()),
+                ('slug', autoslug.fields.AutoSlugField(populate_from='name', unique=True, editable=False)),
+                ('application', models.ForeignKey(related_name='events', to='wot_app.Application')),
+                ('resource', models.ForeignKey(related_name='events', on_delete=django.db.models.deletion.DO_NOTHING,
+                                               to='wot_app.Resource')),
+            ],
+            options=TIMESTAMPED_OPTIONS,
+        ),
+        migrations.CreateModel(
+            name='EventSubscription',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+            ] + timestamps() + [
+                ('notify_url', models.CharField(max_length=255)),
+                ('event', models.ForeignKey(related_name='subscriptions',
+                                            on_delete=django.db.models.deletion.DO_NOTHING, to='wot_app.Event')),
+            ],
+            options=TIMESTAMPED_OPTIONS,
+        ),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django_extensions.db.fields
+import jsonfield.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wot_app', '0002_resourcedata_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='retention_days',
+            field=models.PositiveIntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='retention_days',
+            field=models.PositiveIntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rolled_up_until',
+            field=models.DateTimeField(null=True, editable=False, blank=True),
+        ),
+        migrations.CreateModel(
+            name='ResourceDataRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True,
+                                                                              verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True,
+                                                                                   verbose_name='modified')),
+                ('period', models.CharField(max_length=10, choices=[('hour', 'Hour'), ('day', 'Day')])),
+                ('start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('fields', jsonfield.fields.JSONField(default=dict)),
+                ('resource', models.ForeignKey(related_name='rollups', on_delete=django.db.models.deletion.DO_NOTHING,
+                                               to='wot_app.Resource')),
+            ],
+            options={
+                'ordering': ('-modified', '-created'),
+                'get_latest_by': 'modified',
+                'abstract': False,
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='resourcedatarollup',
+            unique_together=set([('resource', 'period', 'start')]),
+        ),
+    ]
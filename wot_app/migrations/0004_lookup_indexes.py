@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wot_app', '0003_retention'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='resource',
+            index_together=set([('application', 'slug')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('application', 'slug'), ('resource', 'slug')]),
+        ),
+    ]
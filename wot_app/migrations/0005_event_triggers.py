@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wot_app', '0004_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='edge_triggered',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='eventsubscription',
+            name='min_interval',
+            field=models.PositiveIntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='eventsubscription',
+            name='debounce',
+            field=models.PositiveIntegerField(null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wot_app', '0005_event_triggers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventsubscription',
+            name='batch_window',
+            field=models.PositiveIntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='eventsubscription',
+            name='batch_size',
+            field=models.PositiveIntegerField(null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django_extensions.db.fields
+import jsonfield.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wot_app', '0006_subscription_batching'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UndeliveredNotification',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True,
+                                                                              verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True,
+                                                                                   verbose_name='modified')),
+                ('notify_url', models.CharField(max_length=255, db_index=True)),
+                ('payload', jsonfield.fields.JSONField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.CharField(max_length=255, blank=True)),
+            ],
+            options={
+                'ordering': ('-modified', '-created'),
+                'get_latest_by': 'modified',
+                'abstract': False,
+            },
+        ),
+    ]
@@ -6,14 +6,16 @@ from django.core.urlresolvers import reverse
 from django.db import models
 
 # Create your models here.
-from django.db.models.fields import CharField, BooleanField
+from django.db.models.fields import CharField, BooleanField, DateTimeField, PositiveIntegerField
 from django.db.models.fields.related import ForeignKey
 from django.utils.functional import cached_property
 from django_extensions.db.models import TimeStampedModel
 from jsonfield import JSONField
 from oauth2_provider.models import AbstractApplication
 
-from wot_app.exceptions import InvalidResourceDataException
+from wot_app import metrics
+from wot_app.conditions import CompiledCondition
+from wot_app.validators import get_validator
 
 logger = logging.getLogger(__name__)
 
@@ -22,26 +24,12 @@ class Application(AbstractApplication, TimeStampedModel):
 
     is_private = BooleanField(default=False)
     slug = AutoSlugField(populate_from='name', unique=True)
+    retention_days = PositiveIntegerField(null=True, blank=True)
 
     @cached_property
     def url(self):
         return reverse('application', kwargs={'app_slug': self.slug})
 
-    @cached_property
-    def to_dict(self):
-        events = [dict(name=ev.slug, url=ev.url) for ev in self.events.all()]
-        resources = [dict(name=res.slug, url=res.url) for res in self.resources.all()]
-        return {
-            "name": self.slug,
-            "url": self.url,
-            "modified": self.modified,
-            "created": self.created,
-            "data": {
-                "events": events,
-                "resource": resources
-            }
-        }
-
 
 class Resource(TimeStampedModel):
 
@@ -49,50 +37,56 @@ class Resource(TimeStampedModel):
     data_fields = JSONField()
     application = ForeignKey(Application, related_name='resources')
     slug = AutoSlugField(populate_from='name', unique=True)
+    retention_days = PositiveIntegerField(null=True, blank=True)
+    rolled_up_until = DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta(TimeStampedModel.Meta):
+        index_together = [('application', 'slug')]
+
+    @property
+    def effective_retention_days(self):
+        if self.retention_days is not None:
+            return self.retention_days
+        return self.application.retention_days
 
     def validate_data(self, resource_data):
-        extra_fields = set(resource_data.keys()).difference(self.data_fields.keys())
-        if extra_fields:
-            raise InvalidResourceDataException
-
-        for k, val in resource_data.items():
-            expected_type = self.data_fields[k]
-            if type(val).__name__ != expected_type:
-                if expected_type == 'float':
-                    try:
-                        float(val)
-                    except ValueError:
-                        raise InvalidResourceDataException
-                else:
-                    raise InvalidResourceDataException
+        with metrics.stage_seconds.time(stage='validation'):
+            return get_validator(self).validate(resource_data)
+
+    def validate_data_batch(self, samples):
+        with metrics.stage_seconds.time(stage='validation'):
+            return get_validator(self).validate_batch(samples)
 
     @cached_property
     def url(self):
         return reverse('resource', kwargs={'app_slug': self.application.slug,
                                            'res_slug': self.slug})
 
-    @cached_property
-    def to_dict(self):
-        return {
-            "url": self.url,
-            "modified": self.modified,
-            "created": self.created,
-            "data": {
-                "name": self.slug,
-                "data_fields": self.data_fields,
-                "application": {
-                    "name": self.application.slug,
-                    "url": self.application.url
-                }
-            }
-        }
-
 
 class ResourceData(TimeStampedModel):
 
     resource = ForeignKey(Resource, on_delete=models.DO_NOTHING, related_name='all_data')
     data = JSONField()
 
+    class Meta(TimeStampedModel.Meta):
+        index_together = [('resource', 'created', 'id')]
+
+
+class ResourceDataRollup(TimeStampedModel):
+
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = ((HOUR, 'Hour'), (DAY, 'Day'))
+
+    resource = ForeignKey(Resource, on_delete=models.DO_NOTHING, related_name='rollups')
+    period = CharField(max_length=10, choices=PERIOD_CHOICES)
+    start = DateTimeField()
+    count = PositiveIntegerField(default=0)
+    fields = JSONField(default=dict)
+
+    class Meta(TimeStampedModel.Meta):
+        unique_together = [('resource', 'period', 'start')]
+
 
 class Event(TimeStampedModel):
 
@@ -101,13 +95,15 @@ class Event(TimeStampedModel):
     resource = ForeignKey(Resource, on_delete=models.DO_NOTHING, related_name='events')
     application = ForeignKey(Application, related_name='events')
     slug = AutoSlugField(populate_from='name', unique=True)
+    # Occurs only when the condition turns true, not for every matching data
+    edge_triggered = BooleanField(default=False)
+
+    class Meta(TimeStampedModel.Meta):
+        index_together = [('application', 'slug'), ('resource', 'slug')]
 
     def check_condition(self, resource_data):
-        import operator
-        data = resource_data.data
-        cond = self.condition
         try:
-            return all(getattr(operator, opstr)(data[field], value) for field, opstr, value in cond)
+            return CompiledCondition(self.condition)(resource_data.data)
         except:
             logger.exception('Error occurred while checking event condition')
 
@@ -117,31 +113,19 @@ class Event(TimeStampedModel):
                                         'res_slug': self.resource.slug,
                                         'ev_slug': self.slug})
 
-    @cached_property
-    def to_dict(self):
-        return {
-            "url": self.url,
-            "modified": self.modified,
-            "created": self.created,
-            "data": {
-                "resource": {
-                    "name": self.resource.slug,
-                    "url": self.resource.url
-                },
-                "application": {
-                    "name": self.application.slug,
-                    "url": self.application.url
-                },
-                "name": self.slug,
-                "condition": self.condition
-            }
-        }
-
 
 class EventSubscription(TimeStampedModel):
 
     event = ForeignKey(Event, on_delete=models.DO_NOTHING, related_name='subscriptions')
     notify_url = CharField(max_length=255)
+    # Seconds; at most one notification per min_interval, and with debounce
+    # only the last of the occurrences that follow each other closer than that
+    min_interval = PositiveIntegerField(null=True, blank=True)
+    debounce = PositiveIntegerField(null=True, blank=True)
+    # Seconds and items; notifications are then delivered in arrays, at most
+    # batch_window seconds after the first of them
+    batch_window = PositiveIntegerField(null=True, blank=True)
+    batch_size = PositiveIntegerField(null=True, blank=True)
 
     @cached_property
     def url(self):
@@ -150,26 +134,14 @@ class EventSubscription(TimeStampedModel):
                                                'ev_slug': self.event.slug,
                                                'subs_id': self.id})
 
-    @cached_property
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "url": self.url,
-            "modified": self.modified,
-            "created": self.created,
-            "data": {
-                "event": {
-                    "name": self.event.slug,
-                    "url": self.event.url
-                },
-                "resource": {
-                    "name": self.event.resource.slug,
-                    "url": self.event.resource.url
-                },
-                "application": {
-                    "name": self.event.application.slug,
-                    "url": self.event.application.url
-                },
-                "notify_url": self.notify_url
-            }
-        }
+
+class UndeliveredNotification(TimeStampedModel):
+    """
+    Webhook notification given up after its delivery attempts, kept to be
+    replayed with the replay_notifications command.
+    """
+
+    notify_url = CharField(max_length=255, db_index=True)
+    payload = JSONField()
+    attempts = PositiveIntegerField(default=0)
+    error = CharField(max_length=255, blank=True)
@@ -0,0 +1,21 @@
+from oauth2_provider.oauth2_validators import OAuth2Validator
+
+from wot_app.lookups import get_access_token
+
+
+class CachedOAuth2Validator(OAuth2Validator):
+    """
+    Validates bearer tokens against the access token cache instead of
+    querying the database on every API request.
+    """
+
+    def validate_bearer_token(self, token, scopes, request):
+        access_token = get_access_token(token)
+        if access_token is None or not access_token.allow_scopes(scopes):
+            return False
+
+        request.client = access_token.application
+        request.user = access_token.user
+        request.scopes = scopes
+        request.access_token = access_token
+        return True
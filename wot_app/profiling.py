@@ -0,0 +1,89 @@
+"""
+Per-request profile of the API requests, collected by ProfilingMiddleware.
+
+While a request is profiled, the time spent in SQL queries, the cache and the
+serialization of responses is added up in a thread-local RequestProfile.
+Outside of profiled requests the hooks below cost a thread-local lookup.
+"""
+import threading
+import time
+
+from django_redis.cache import RedisCache
+
+_local = threading.local()
+
+_MISSING = object()
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        self.serialization_time = 0.0
+
+
+def start_profile():
+    _local.profile = RequestProfile()
+    return _local.profile
+
+
+def stop_profile():
+    profile = getattr(_local, 'profile', None)
+    _local.profile = None
+    return profile
+
+
+def current_profile():
+    return getattr(_local, 'profile', None)
+
+
+class serialization_timer:
+    """
+    Adds the time spent in the block to the serialization time of the request
+    being profiled, if any.
+    """
+
+    def __enter__(self):
+        self.profile = current_profile()
+        if self.profile is not None:
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.serialization_time += time.perf_counter() - self.started
+
+
+class ProfiledRedisCache(RedisCache):
+    """
+    Redis cache backend that counts the hits and misses of profiled requests.
+    """
+
+    def get(self, key, default=None, version=None, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super().get(key, default, version=version, **kwargs)
+
+        started = time.perf_counter()
+        value = super().get(key, _MISSING, version=version, **kwargs)
+        profile.cache_time += time.perf_counter() - started
+        if value is _MISSING:
+            profile.cache_misses += 1
+            return default
+        profile.cache_hits += 1
+        return value
+
+    def get_many(self, keys, version=None, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super().get_many(keys, version=version, **kwargs)
+
+        keys = list(keys)
+        started = time.perf_counter()
+        values = super().get_many(keys, version=version, **kwargs)
+        profile.cache_time += time.perf_counter() - started
+        profile.cache_hits += len(values)
+        profile.cache_misses += len(keys) - len(values)
+        return values
@@ -0,0 +1,153 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_CHANNEL = 'wot:stream:resource:{}'
+RESOURCE_CHANNEL_PATTERN = 'wot:stream:resource:*'
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.StrictRedis.from_url(getattr(settings, 'WOT_REDIS_URL', 'redis://localhost:6379/2'))
+    return _redis
+
+
+def _publish(messages):
+    """
+    Publishes (resource id, message) pairs to the resource streams in one
+    round trip. Failures are logged and never fail the write being published.
+    """
+    if not messages:
+        return
+
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for resource_id, message in messages:
+            pipeline.publish(RESOURCE_CHANNEL.format(resource_id), json.dumps(message, cls=DjangoJSONEncoder))
+        pipeline.execute()
+    except Exception:
+        logger.exception('Publishing to the resource streams failed')
+
+
+def publish_resource_data(resource_data_list):
+    _publish([(resource_data.resource_id, {
+        'type': 'data',
+        'id': resource_data.id,
+        'data': resource_data.data,
+        'time': resource_data.created,
+    }) for resource_data in resource_data_list])
+
+
+def publish_event_occurrences(occurrences):
+    _publish([(resource_data.resource_id, {
+        'type': 'event',
+        'id': resource_data.id,
+        'event': event.slug,
+        'data': resource_data.data,
+        'time': resource_data.created,
+    }) for event, resource_data in occurrences])
+
+
+class Subscriber:
+    """
+    Bounded inbox of a connected stream client. A client that falls behind
+    loses its oldest messages rather than holding up the others.
+    """
+
+    def __init__(self, resource_id, maxsize=100):
+        self.resource_id = resource_id
+        self.inbox = queue.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        while True:
+            try:
+                self.inbox.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.inbox.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        try:
+            return self.inbox.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    """
+    Fans the messages published for the resources out to the stream clients
+    connected to this process, through a single Redis subscription, so that
+    a write reaches any number of clients without any database query.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, resource_id):
+        self._ensure_listener()
+        subscriber = Subscriber(resource_id)
+        with self._lock:
+            self._subscribers[resource_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.resource_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.resource_id]
+
+    def _ensure_listener(self):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name='wot-stream-broker', daemon=True)
+                    self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(RESOURCE_CHANNEL_PATTERN)
+                for message in pubsub.listen():
+                    self._dispatch(message)
+            except Exception:
+                logger.exception('Stream broker lost its Redis subscription, reconnecting')
+                time.sleep(1)
+
+    def _dispatch(self, message):
+        channel = message['channel']
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        resource_id = int(channel.rsplit(':', 1)[1])
+
+        subscribers = self._subscribers.get(resource_id)
+        if not subscribers:
+            return
+
+        payload = json.loads(message['data'].decode())
+        with self._lock:
+            subscribers = list(subscribers)
+        for subscriber in subscribers:
+            subscriber.put(payload)
+
+
+broker = LocalBroker()
@@ -0,0 +1,109 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from wot_app.history import add_sample_stats, merge_stats
+from wot_app.lookups import invalidate_resource
+from wot_app.models import Resource, ResourceData, ResourceDataRollup
+from wot_app.validators import numeric_fields
+
+logger = logging.getLogger(__name__)
+
+PERIOD_STARTS = {
+    ResourceDataRollup.HOUR: lambda time: time.replace(minute=0, second=0, microsecond=0),
+    ResourceDataRollup.DAY: lambda time: time.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def _aggregate(rows, fields):
+    aggregates = {}
+    for pk, created, data in rows:
+        for period, period_start in PERIOD_STARTS.items():
+            key = (period, period_start(created))
+            aggregate = aggregates.get(key)
+            if aggregate is None:
+                aggregate = aggregates[key] = {'count': 0, 'fields': {}}
+            aggregate['count'] += 1
+            add_sample_stats(aggregate['fields'], data, fields)
+    return aggregates
+
+
+def _save_rollups(resource, aggregates):
+    existing = ResourceDataRollup.objects.select_for_update().filter(
+        resource=resource,
+        start__in={start for _, start in aggregates})
+    existing = {(rollup.period, rollup.start): rollup for rollup in existing}
+
+    created = []
+    for (period, start), aggregate in aggregates.items():
+        rollup = existing.get((period, start))
+        if rollup is None:
+            created.append(ResourceDataRollup(resource=resource, period=period, start=start,
+                                              count=aggregate['count'], fields=aggregate['fields']))
+        else:
+            rollup.count += aggregate['count']
+            merge_stats(rollup.fields, aggregate['fields'])
+            rollup.save(update_fields=['count', 'fields', 'modified'])
+
+    ResourceDataRollup.objects.bulk_create(created)
+
+
+def rollup_resource_data(resource, now=None, batch_size=None, max_batches=None):
+    """
+    Rolls the samples of the resource that are older than its retention period
+    into hourly and daily rollups and deletes them, in bounded batches. The
+    latest sample is always kept so that the latest state stays readable.
+    Returns the number of samples rolled up.
+    """
+    retention_days = resource.effective_retention_days
+    if retention_days is None:
+        return 0
+
+    batch_size = batch_size or getattr(settings, 'WOT_ROLLUP_BATCH_SIZE', 5000)
+    max_batches = max_batches or getattr(settings, 'WOT_ROLLUP_MAX_BATCHES', 100)
+    now = now or timezone.now()
+    cutoff = PERIOD_STARTS[ResourceDataRollup.DAY](now - timedelta(days=retention_days))
+    fields = numeric_fields(resource.data_fields)
+
+    latest_id = resource.all_data.order_by('id').values_list('id', flat=True).last()
+    expired = resource.all_data.filter(created__lt=cutoff).exclude(id=latest_id).order_by('created', 'id')
+
+    total = 0
+    for _ in range(max_batches):
+        with transaction.atomic():
+            # Concurrent rollups of the resource wait here and then read only
+            # the rows left behind, so that no sample is counted twice
+            list(Resource.objects.select_for_update().filter(pk=resource.pk).values_list('pk', flat=True))
+            rows = list(expired.values_list('id', 'created', 'data')[:batch_size])
+            if not rows:
+                break
+
+            _save_rollups(resource, _aggregate(rows, fields))
+            ResourceData.objects.filter(id__in=[pk for pk, _, _ in rows]).delete()
+        total += len(rows)
+
+    # Raw samples are served from the earliest remaining one on
+    first_raw = resource.all_data.order_by('created', 'id').values_list('created', flat=True).first()
+    boundary = min(cutoff, first_raw) if first_raw else cutoff
+    if resource.rolled_up_until is None or boundary > resource.rolled_up_until:
+        Resource.objects.filter(pk=resource.pk).update(rolled_up_until=boundary)
+        resource.rolled_up_until = boundary
+        invalidate_resource(resource)
+
+    logger.info('Rolled up %s samples of resource %s older than %s', total, resource.slug, cutoff)
+    return total
+
+
+def rollup_all_resource_data(now=None):
+    total = 0
+    resources = Resource.objects.select_related('application').exclude(
+        retention_days__isnull=True, application__retention_days__isnull=True)
+    for resource in resources.iterator():
+        try:
+            total += rollup_resource_data(resource, now=now)
+        except Exception:
+            logger.exception('Rollup failed for resource %s', resource.slug)
+    return total
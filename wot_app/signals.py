@@ -1,20 +1,111 @@
-from django.db.models.signals import post_save, pre_save
-from django.dispatch import receiver
+import time
 
-from wot_app.tasks import task_check_event_condition
+from django.db.models.signals import post_save, pre_save, post_delete
+from django.dispatch import receiver, Signal
+from oauth2_provider.models import AccessToken
+
+from wot_app import metrics
+from wot_app.caching import touch_stamp, APPLICATION_STAMP_KEY, RESOURCE_STAMP_KEY, EVENT_STAMP_KEY
+from wot_app.conditions import match_events, update_event_index
+from wot_app.definitions import invalidate_event_definition, resource_data_payload
+from wot_app.lookups import invalidate_access_token, invalidate_application, invalidate_resource
+from wot_app.pubsub import publish_resource_data, publish_event_occurrences
+from wot_app.state import set_latest_state
+from wot_app.tasks import task_notify_event_subscribers
+from wot_app.triggers import reset_event_state
 from . import models
 
+# Sent once per resource after a batch of ResourceData rows is inserted with
+# bulk_create, which bypasses the per-instance pre_save/post_save signals.
+resource_data_bulk_post_save = Signal(providing_args=['resource', 'instances'])
+
+
+def dispatch_matched_events(resource, resource_data_list):
+    occurrences = match_events(resource, resource_data_list)
+    for event, resource_data in occurrences:
+        task_notify_event_subscribers.delay(event.id, resource_data_payload(resource_data))
+    publish_event_occurrences(occurrences)
+    if occurrences:
+        metrics.event_occurrences_total.inc(len(occurrences))
+
 
 @receiver(pre_save, sender=models.ResourceData)
 def resource_data_pre_save(sender, **kwargs):
     resource_data = kwargs['instance']
     resource = resource_data.resource
-    resource.validate_data(resource_data.data)
+    resource_data.data = resource.validate_data(resource_data.data)
+    resource_data._insert_started = time.perf_counter()
 
 
 @receiver(post_save, sender=models.ResourceData)
 def resource_data_post_save(sender, **kwargs):
     resource_data = kwargs['instance']
-    resource = resource_data.resource
-    for event in resource.events.all():
-        task_check_event_condition.delay(event, resource_data)
\ No newline at end of file
+    insert_started = getattr(resource_data, '_insert_started', None)
+    if insert_started is not None:
+        metrics.stage_seconds.observe(time.perf_counter() - insert_started, stage='insert')
+        metrics.resource_data_written_total.inc()
+
+    with metrics.stage_seconds.time(stage='fan_out'):
+        set_latest_state(resource_data)
+        publish_resource_data([resource_data])
+        dispatch_matched_events(resource_data.resource, [resource_data])
+
+
+@receiver(resource_data_bulk_post_save, sender=models.ResourceData)
+def resource_data_bulk_post_save_handler(sender, resource, instances, **kwargs):
+    with metrics.stage_seconds.time(stage='fan_out'):
+        set_latest_state(instances[-1])
+        publish_resource_data(instances)
+        dispatch_matched_events(resource, instances)
+
+
+@receiver(post_save, sender=models.Resource)
+@receiver(post_delete, sender=models.Resource)
+def resource_changed(sender, **kwargs):
+    resource = kwargs['instance']
+    invalidate_resource(resource)
+    touch_stamp(APPLICATION_STAMP_KEY.format(resource.application_id))
+
+
+def touch_event_stamps(event):
+    touch_stamp(APPLICATION_STAMP_KEY.format(event.application_id))
+    touch_stamp(RESOURCE_STAMP_KEY.format(event.resource_id))
+
+
+@receiver(post_save, sender=models.Event)
+def event_post_save(sender, **kwargs):
+    update_event_index(kwargs['instance'])
+    reset_event_state(kwargs['instance'])
+    invalidate_event_definition(kwargs['instance'].id)
+    touch_event_stamps(kwargs['instance'])
+
+
+@receiver(post_delete, sender=models.Event)
+def event_post_delete(sender, **kwargs):
+    update_event_index(kwargs['instance'], deleted=True)
+    reset_event_state(kwargs['instance'])
+    invalidate_event_definition(kwargs['instance'].id)
+    touch_event_stamps(kwargs['instance'])
+
+
+@receiver(post_save, sender=models.EventSubscription)
+@receiver(post_delete, sender=models.EventSubscription)
+def event_subscription_changed(sender, **kwargs):
+    invalidate_event_definition(kwargs['instance'].event_id)
+    touch_stamp(EVENT_STAMP_KEY.format(kwargs['instance'].event_id))
+
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def access_token_changed(sender, **kwargs):
+    invalidate_access_token(kwargs['instance'].token)
+
+
+@receiver(post_save, sender=models.Application)
+@receiver(post_delete, sender=models.Application)
+def application_changed(sender, **kwargs):
+    application = kwargs['instance']
+    invalidate_application(application.slug)
+    # Cached access tokens carry their application along
+    for token in AccessToken.objects.filter(application=application).values_list('token', flat=True):
+        invalidate_access_token(token)
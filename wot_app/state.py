@@ -0,0 +1,107 @@
+import logging
+
+from django.core.cache import cache, caches
+from django_redis.cache import RedisCache
+
+from wot_app.models import ResourceData
+
+logger = logging.getLogger(__name__)
+
+LATEST_STATE_KEY = 'wot:resource:latest:{}'
+# Order of the cached state, "created:id", compared before replacing it
+LATEST_STATE_ORDER_KEY = 'wot:resource:latest-order:{}'
+
+# Replaces the state unless the cached one is of a later sample by (created, id)
+SET_IF_LATER_SCRIPT = """
+local current = redis.call('GET', KEYS[2])
+if current then
+    local created, id = string.match(current, '^(%-?%d+):(%-?%d+)$')
+    local new_created, new_id = tonumber(ARGV[1]), tonumber(ARGV[2])
+    if new_created < tonumber(created) or (new_created == tonumber(created) and new_id < tonumber(id)) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[2], ARGV[1] .. ':' .. ARGV[2])
+redis.call('SET', KEYS[1], ARGV[3])
+return 1
+"""
+
+_set_if_later = None
+
+
+def _state_entry(resource_data):
+    return {'id': resource_data.id, 'data': resource_data.data, 'time': resource_data.created}
+
+
+def _order(entry):
+    return int(entry['time'].timestamp() * 1000000), entry['id'] if entry['id'] is not None else -1
+
+
+def _store_state(resource_id, entry):
+    """
+    Caches the state entry of the resource unless the cached one is of a later
+    sample. On Redis the check and the write are a single script, so that
+    concurrent writers cannot roll the state back.
+    """
+    global _set_if_later
+    backend = caches['default']
+    key = LATEST_STATE_KEY.format(resource_id)
+    if not isinstance(backend, RedisCache):
+        current = backend.get(key)
+        if current is None or _order(entry) >= _order(current):
+            backend.set(key, entry, timeout=None)
+        return
+
+    client = backend.client
+    redis = client.get_client(write=True)
+    if _set_if_later is None:
+        _set_if_later = redis.register_script(SET_IF_LATER_SCRIPT)
+    _set_if_later(keys=[client.make_key(key), client.make_key(LATEST_STATE_ORDER_KEY.format(resource_id))],
+                  args=list(_order(entry)) + [client.encode(entry)], client=redis)
+
+
+def set_latest_state(resource_data):
+    """
+    Writes the sample through to the latest-state cache of its resource unless
+    a later sample has already been cached by a concurrent write.
+    """
+    _store_state(resource_data.resource_id, _state_entry(resource_data))
+
+
+def get_latest_state(resource):
+    """
+    Returns the latest state entry of the resource, falling back to the
+    database on a cache miss. Returns None if the resource has no data yet.
+    """
+    key = LATEST_STATE_KEY.format(resource.id)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    resource_data = resource.all_data.order_by('created', 'id').last()
+    if resource_data is None:
+        return None
+
+    entry = _state_entry(resource_data)
+    _store_state(resource.id, entry)
+    return entry
+
+
+def get_latest_states(resources):
+    """
+    Returns the latest state entries of the resources by resource id, None
+    for those without data yet. Cache misses are read from the database with
+    a single DISTINCT ON query.
+    """
+    keys = {resource.id: LATEST_STATE_KEY.format(resource.id) for resource in resources}
+    cached = cache.get_many(keys.values())
+    states = {resource_id: cached.get(key) for resource_id, key in keys.items()}
+
+    missing = [resource_id for resource_id, entry in states.items() if entry is None]
+    if missing:
+        latest = ResourceData.objects.filter(resource_id__in=missing) \
+            .order_by('resource_id', '-created', '-id').distinct('resource_id')
+        for resource_data in latest:
+            entry = states[resource_data.resource_id] = _state_entry(resource_data)
+            _store_state(resource_data.resource_id, entry)
+    return states
@@ -1,38 +1,190 @@
 import json
 import logging
+import random
 import time
 
-import requests
+from celery.signals import before_task_publish, task_prerun
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from tow.celery import app
+from wot_app import metrics
+from wot_app.batching import add_to_batch, batch_size, take_batch
+from wot_app.definitions import get_event_definition
+from wot_app.delivery import get_delivery_engine
+from wot_app.models import UndeliveredNotification
+from wot_app.retention import rollup_all_resource_data
+from wot_app.triggers import allow_notification, debounce_occurrence, take_debounced_occurrence
 
 logger = logging.getLogger(__name__)
 
+PUBLISHED_HEADER = 'wot_published'
 
-@app.task
-def task_notify_event_subscriber(event, subscription, resource_data):
-    event_data = {
-        'name': event.slug,
-        'application': event.application.slug,
+
+@before_task_publish.connect
+def stamp_published_task(sender=None, headers=None, **kwargs):
+    if headers is not None:
+        headers[PUBLISHED_HEADER] = time.time()
+
+
+@task_prerun.connect
+def observe_task_lag(sender=None, task=None, **kwargs):
+    published = (getattr(task.request, 'headers', None) or {}).get(PUBLISHED_HEADER)
+    if published is None:
+        return
+
+    # Tasks with a countdown are late only past their ETA
+    eta = getattr(task.request, 'eta', None)
+    if isinstance(eta, str):
+        eta = parse_datetime(eta)
+    if eta is not None:
+        if timezone.is_naive(eta):
+            eta = timezone.make_aware(eta, timezone.utc)
+        published = max(published, eta.timestamp())
+    metrics.celery_task_lag_seconds.observe(max(0.0, time.time() - published), task=task.name)
+
+
+def _event_data(event, resource_data):
+    return {
+        'name': event.name,
+        'application': event.application,
         'resource': {
-            'name': event.resource.slug,
-            'data': resource_data.data,
+            'name': event.resource,
+            'data': resource_data['data'],
         }
     }
-    logger.warning('Notify URL: {}'.format(subscription.notify_url))
+
+
+def retry_delay(attempt):
+    """
+    Seconds to wait before the given delivery attempt: exponentially growing,
+    capped, and jittered so that the retries of a burst of failures spread out.
+    """
+    base = getattr(settings, 'WOT_WEBHOOK_RETRY_DELAY', 5)
+    delay = min(base * 2 ** (attempt - 2), getattr(settings, 'WOT_WEBHOOK_RETRY_MAX_DELAY', 600))
+    return delay * random.uniform(0.5, 1)
+
+
+def _deliver(notifications, attempt=1):
+    """
+    Delivers the (url, payload) notifications. The failed ones are retried
+    later, or stored as undelivered once they run out of attempts or failed
+    for good.
+    """
+    failures = get_delivery_engine().deliver(notifications)
+    max_attempts = getattr(settings, 'WOT_WEBHOOK_MAX_ATTEMPTS', 6)
+
+    for (url, payload), failure in zip(notifications, failures):
+        if failure is None:
+            continue
+
+        host = metrics.host_label(metrics.url_host(url))
+        if failure.retryable and attempt < max_attempts:
+            metrics.webhook_retries_total.inc(host=host)
+            task_retry_notification.apply_async((url, payload, attempt + 1), countdown=retry_delay(attempt + 1))
+        else:
+            logger.error('Event notification to %s given up after %s attempts: %s', url, attempt, failure.error)
+            metrics.webhook_dead_letters_total.inc(host=host)
+            UndeliveredNotification.objects.create(notify_url=url, payload=payload, attempts=attempt,
+                                                   error=failure.error[:255])
+
+
+def _notify(event, subscriptions, resource_data):
+    event_data = _event_data(event, resource_data)
+
+    notifications = []
+    for subscription in subscriptions:
+        if subscription.batch_window:
+            size = add_to_batch(subscription, event_data, resource_data['time'])
+            if size is not None:
+                if size >= batch_size(subscription):
+                    task_deliver_notification_batch.delay(subscription.notify_url, batch_size(subscription),
+                                                          subscription.batch_window)
+                elif size == 1:
+                    task_deliver_notification_batch.apply_async(
+                        (subscription.notify_url, batch_size(subscription), subscription.batch_window),
+                        countdown=subscription.batch_window)
+                continue
+        notifications.append((subscription.notify_url, event_data))
+
+    if not notifications:
+        return
+
+    logger.warning('Notify URLs: {}'.format([url for url, _ in notifications]))
     logger.warning('Event data: {}'.format(json.dumps(event_data)))
 
-    try:
-        requests.post(subscription.notify_url, json=event_data)
-    except:
-        logger.exception('Event notification failed')
+    _deliver(notifications)
+
+
+@app.task
+def task_notify_event_subscribers(event_id, resource_data):
+    event = get_event_definition(event_id)
+    if event is None:
+        logger.info('Dropped the notification of deleted event %s', event_id)
+        return
+
+    subscriptions = []
+    for subscription in event.subscriptions:
+        if subscription.debounce:
+            # One task per burst, the occurrences in between only replace
+            # the one it notifies
+            schedule = debounce_occurrence(subscription, resource_data, time.time())
+            if schedule:
+                task_notify_debounced_subscriber.apply_async((event_id, subscription.id),
+                                                             countdown=subscription.debounce)
+            if schedule is not None:
+                continue
+        if allow_notification(subscription):
+            subscriptions.append(subscription)
+
+    _notify(event, subscriptions, resource_data)
 
 
 @app.task
-def task_check_event_condition(event, resource_data):
-    if not event.check_condition(resource_data):
+def task_notify_debounced_subscriber(event_id, subscription_id):
+    """
+    Notifies the subscriber of the last occurrence of a burst once the event
+    has not occurred for the debounce period of the subscription, or checks
+    again when that period would be over.
+    """
+    event = get_event_definition(event_id)
+    if event is None:
+        logger.info('Dropped the notification of deleted event %s', event_id)
         return
 
-    for subs in event.subscriptions.all():
-        task_notify_event_subscriber.delay(event, subs, resource_data)
-        time.sleep(1)
+    subscription = next((subs for subs in event.subscriptions if subs.id == subscription_id), None)
+    if subscription is None or not subscription.debounce:
+        return
+
+    wait, resource_data = take_debounced_occurrence(subscription, time.time())
+    if wait is not None:
+        task_notify_debounced_subscriber.apply_async((event_id, subscription_id), countdown=wait)
+    elif resource_data is not None and allow_notification(subscription):
+        _notify(event, [subscription], resource_data)
+
+
+@app.task
+def task_deliver_notification_batch(notify_url, size, window):
+    """
+    Delivers up to size of the batched notifications of the notify URL as one
+    array, and schedules the delivery of those left behind.
+    """
+    events, remaining = take_batch(notify_url, size)
+    if events:
+        _deliver([(notify_url, events)])
+
+    if remaining:
+        task_deliver_notification_batch.apply_async((notify_url, size, window),
+                                                    countdown=0 if remaining >= size else window)
+
+
+@app.task
+def task_retry_notification(notify_url, payload, attempt):
+    _deliver([(notify_url, payload)], attempt)
+
+
+@app.task
+def task_rollup_resource_data():
+    total = rollup_all_resource_data()
+    logger.info('Rolled up %s resource data samples', total)
@@ -1,3 +1,151 @@
-from django.test import TestCase
+import logging
+import random
+import uuid
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from wot_app.conditions import EventConditionIndex
+from wot_app.models import Application, Resource, ResourceData, Event, EventSubscription
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ListingQueryCountTest(TestCase):
+    """
+    The API endpoints issue the same number of queries whatever the number of
+    objects they list. Every request starts with a cold cache, so that the
+    lookups cached by earlier requests do not skew the counts.
+    """
+    small = 2
+    large = 20
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='wot-test')
+        self.application = Application.objects.create(
+            name='test-app', user=self.user, client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_CLIENT_CREDENTIALS)
+        self.token = AccessToken.objects.create(
+            user=self.user, application=self.application, token=uuid.uuid4().hex,
+            expires=timezone.now() + timedelta(days=1), scope='read write')
+        self.resource = self._create_resource()
+        self.event = self._create_event(self.resource)
+        self.subscription = EventSubscription.objects.create(event=self.event, notify_url='http://example.com/hook')
+
+    def _create_resource(self):
+        return Resource.objects.create(name='resource-{}'.format(uuid.uuid4().hex[:8]), application=self.application,
+                                       data_fields={'value': 'float'})
+
+    def _create_event(self, resource):
+        return Event.objects.create(name='event-{}'.format(uuid.uuid4().hex[:8]), application=self.application,
+                                    resource=resource, condition=[['value', 'gt', 0]])
+
+    def _grow(self, count):
+        """
+        Adds resources, events and subscriptions until every listing has at
+        least count items.
+        """
+        while self.application.resources.count() < count:
+            self._create_event(self._create_resource())
+        while self.resource.events.count() < count:
+            self._create_event(self.resource)
+        while self.event.subscriptions.count() < count:
+            EventSubscription.objects.create(event=self.event, notify_url='http://example.com/hook')
+
+    def _get(self, url):
+        cache.clear()
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer {}'.format(self.token.token))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertConstantQueries(self, url):
+        self._grow(self.small)
+        with CaptureQueriesContext(connection) as queries:
+            self._get(url)
+
+        self._grow(self.large)
+        with self.assertNumQueries(len(queries)):
+            self._get(url)
+
+    def test_application(self):
+        self.assertConstantQueries(self.application.url)
+
+    def test_resource_list(self):
+        self.assertConstantQueries('{}resources/'.format(self.application.url))
+
+    def test_resource(self):
+        self.assertConstantQueries(self.resource.url)
+
+    def test_event_list(self):
+        self.assertConstantQueries('{}events/'.format(self.resource.url))
+
+    def test_event(self):
+        self.assertConstantQueries(self.event.url)
+
+    def test_subscription_list(self):
+        self.assertConstantQueries('{}subscriptions/'.format(self.event.url))
+
+    def test_subscription(self):
+        self.assertConstantQueries(self.subscription.url)
+
+
+class EventConditionIndexTest(SimpleTestCase):
+    """
+    The condition index matches exactly the events whose conditions hold when
+    checked one by one, whatever the operators and the types of the values.
+    """
+    fields = ('a', 'b', 'c')
+    operators = ('gt', 'ge', 'lt', 'le', 'eq', 'ne')
+    values = (-1, 0, 0.5, 1, 2, 10, True, 'x', 'y', None, [1], [1, 2], {'k': 1})
+
+    def setUp(self):
+        # Comparing e.g. a string with a number fails, and the failure is logged
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.random = random.Random(3)
+
+    def _condition(self):
+        return [[self.random.choice(self.fields), self.random.choice(self.operators), self.random.choice(self.values)]
+                for _ in range(self.random.randint(1, 3))]
+
+    def _data(self):
+        return {field: self.random.choice(self.values) for field in self.fields if self.random.random() < 0.8}
+
+    def assertMatchesEachEvent(self, index, events, data):
+        expected = {event.id for event in events if event.check_condition(ResourceData(data=data))}
+        self.assertEqual({event.id for event in index.match(data)}, expected, 'data: {}'.format(data))
+
+    def test_random_conditions(self):
+        events = [Event(id=i, slug='event-{}'.format(i), condition=self._condition()) for i in range(200)]
+        index = EventConditionIndex(events)
+        for _ in range(500):
+            self.assertMatchesEachEvent(index, events, self._data())
+
+        for event in events[::2]:
+            index.discard(event.id)
+        for _ in range(500):
+            self.assertMatchesEachEvent(index, events[1::2], self._data())
+
+    def test_unindexed_conditions(self):
+        events = [Event(id=1, slug='list', condition=[['a', 'eq', [1, 2]]]),
+                  Event(id=2, slug='text', condition=[['a', 'gt', 'x']]),
+                  Event(id=3, slug='dict', condition=[['a', 'ne', {'k': 1}]])]
+        index = EventConditionIndex(events)
+        for value in self.values:
+            self.assertMatchesEachEvent(index, events, {'a': value})
+
+    def test_unhashable_values(self):
+        events = [Event(id=1, slug='eq', condition=[['a', 'eq', 1]]),
+                  Event(id=2, slug='ne', condition=[['a', 'ne', 1]]),
+                  Event(id=3, slug='gt', condition=[['a', 'gt', 0]])]
+        index = EventConditionIndex(events)
+        for value in ([1], [1, 2], {'k': 1}):
+            self.assertMatchesEachEvent(index, events, {'a': value})
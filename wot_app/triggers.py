@@ -0,0 +1,195 @@
+"""
+Trigger state of events and subscriptions, kept in Redis so that it is shared
+by all the processes that write resource data or deliver notifications.
+
+- Edge-triggered events remember whether their condition held for the last
+  data of the resource, and occur only when it turns from false to true.
+- Subscriptions with min_interval are notified at most once per interval.
+- Subscriptions with debounce are notified of the last occurrence of a burst,
+  once the event has not occurred again for debounce seconds.
+
+Redis being unavailable never holds notifications back: events then occur
+and subscribers are notified as if there were no trigger settings.
+"""
+import json
+import logging
+
+from wot_app.pubsub import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Hash of the edge-triggered events of a resource whose condition held for its
+# last data, by event id
+RESOURCE_EVENT_STATES_KEY = 'wot:resource:event-states:{}'
+SUBSCRIPTION_LAST_KEY = 'wot:subscription:last:{}'
+# Hash of the data and time of the latest occurrence of a debounced
+# subscription, and the flag of the task pending to notify it
+SUBSCRIPTION_DEBOUNCE_KEY = 'wot:subscription:debounce:{}'
+SUBSCRIPTION_DEBOUNCE_PENDING_KEY = 'wot:subscription:debounce-pending:{}'
+
+# Replaces the held events of the resource with those holding for the new
+# data. ARGV lists the events that matched any of the new data, each followed
+# by 1 if it holds for the last of them, and the states they had are returned.
+SWAP_EVENT_STATES_SCRIPT = """
+local previous = {}
+local held = {}
+for i = 1, #ARGV, 2 do
+    previous[#previous + 1] = redis.call('HEXISTS', KEYS[1], ARGV[i])
+    if ARGV[i + 1] == '1' then
+        held[#held + 1] = ARGV[i]
+        held[#held + 1] = '1'
+    end
+end
+redis.call('DEL', KEYS[1])
+if #held > 0 then
+    redis.call('HMSET', KEYS[1], unpack(held))
+end
+return previous
+"""
+
+# Takes the latest occurrence once ARGV[2] seconds have passed since it at
+# ARGV[1], otherwise returns the seconds left and keeps the task pending
+TAKE_DEBOUNCED_SCRIPT = """
+local at = redis.call('HGET', KEYS[1], 'at')
+if not at then
+    redis.call('DEL', KEYS[2])
+    return {}
+end
+local wait = tonumber(at) + tonumber(ARGV[2]) - tonumber(ARGV[1])
+if wait > 0 then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    return {'wait', tostring(wait)}
+end
+local data = redis.call('HGET', KEYS[1], 'data')
+redis.call('DEL', KEYS[1], KEYS[2])
+return {'data', data}
+"""
+
+_swap_event_states_script = None
+_take_debounced_script = None
+
+
+def _swap_event_states(resource_id, matched, held):
+    """
+    Stores which of the matched events hold for the last data of the resource
+    and returns the states the matched events had, in one atomic script, so
+    that concurrent writers chain up. Events that did not match are cleared.
+    """
+    global _swap_event_states_script
+    event_ids = list(matched)
+    try:
+        redis = get_redis()
+        if _swap_event_states_script is None:
+            _swap_event_states_script = redis.register_script(SWAP_EVENT_STATES_SCRIPT)
+        previous = _swap_event_states_script(
+            keys=[RESOURCE_EVENT_STATES_KEY.format(resource_id)],
+            args=[value for event_id in event_ids for value in (event_id, 1 if event_id in held else 0)])
+    except Exception:
+        logger.exception('Reading the state of edge-triggered events failed')
+        return {}
+    return {event_id: bool(value) for event_id, value in zip(event_ids, previous)}
+
+
+def filter_transitions(resource_id, edge_triggered, resource_data_list, occurrences):
+    """
+    Keeps the occurrences of the edge-triggered events that are false-to-true
+    transitions over the batch of resource data, along with all occurrences
+    of the other events. edge_triggered maps event ids to events.
+    """
+    if not resource_data_list:
+        return occurrences
+
+    matched = {}
+    for event, resource_data in occurrences:
+        if event.id in edge_triggered:
+            matched.setdefault(event.id, set()).add(id(resource_data))
+    last = id(resource_data_list[-1])
+    previous = _swap_event_states(resource_id, matched, {event_id for event_id, data_ids in matched.items()
+                                                         if last in data_ids})
+
+    # Events that matched none of the data have no transitions to look for
+    transitions = set()
+    for event_id, data_ids in matched.items():
+        held = previous.get(event_id, False)
+        for resource_data in resource_data_list:
+            state = id(resource_data) in data_ids
+            if state and not held:
+                transitions.add((event_id, id(resource_data)))
+            held = state
+
+    return [(event, resource_data) for event, resource_data in occurrences
+            if event.id not in edge_triggered or (event.id, id(resource_data)) in transitions]
+
+
+def reset_event_state(event):
+    try:
+        get_redis().hdel(RESOURCE_EVENT_STATES_KEY.format(event.resource_id), event.id)
+    except Exception:
+        logger.exception('Resetting the state of event %s failed', event.id)
+
+
+def allow_notification(subscription):
+    """
+    Returns whether the subscription could be notified now, and if so starts
+    its minimum interval.
+    """
+    if not subscription.min_interval:
+        return True
+
+    try:
+        return bool(get_redis().set(SUBSCRIPTION_LAST_KEY.format(subscription.id), '1',
+                                    ex=subscription.min_interval, nx=True))
+    except Exception:
+        logger.exception('Checking the interval of subscription %s failed', subscription.id)
+        return True
+
+
+def _debounce_timeout(subscription):
+    return subscription.debounce * 2 + 60
+
+
+def debounce_occurrence(subscription, resource_data, now):
+    """
+    Records the occurrence as the latest of the burst of the debounced
+    subscription. Returns True if a task has to be scheduled to notify the
+    burst, False if one is pending already, and None if Redis failed and the
+    occurrence should be notified right away.
+    """
+    key = SUBSCRIPTION_DEBOUNCE_KEY.format(subscription.id)
+    timeout = _debounce_timeout(subscription)
+    try:
+        pipeline = get_redis().pipeline()
+        pipeline.hmset(key, {'at': repr(now), 'data': json.dumps(resource_data)})
+        pipeline.expire(key, timeout)
+        # Expires on its own if the pending task is lost
+        pipeline.set(SUBSCRIPTION_DEBOUNCE_PENDING_KEY.format(subscription.id), '1', ex=timeout, nx=True)
+        return bool(pipeline.execute()[2])
+    except Exception:
+        logger.exception('Debouncing subscription %s failed', subscription.id)
+        return None
+
+
+def take_debounced_occurrence(subscription, now):
+    """
+    Returns (None, resource_data) of the latest occurrence of the debounced
+    subscription if the event has not occurred since for its debounce period,
+    and (seconds, None) if it has and the burst should be checked again in
+    that many seconds. Returns (None, None) if there is nothing to notify.
+    """
+    global _take_debounced_script
+    try:
+        redis = get_redis()
+        if _take_debounced_script is None:
+            _take_debounced_script = redis.register_script(TAKE_DEBOUNCED_SCRIPT)
+        result = _take_debounced_script(keys=[SUBSCRIPTION_DEBOUNCE_KEY.format(subscription.id),
+                                              SUBSCRIPTION_DEBOUNCE_PENDING_KEY.format(subscription.id)],
+                                        args=[repr(now), subscription.debounce, _debounce_timeout(subscription)])
+    except Exception:
+        logger.exception('Debouncing subscription %s failed', subscription.id)
+        return None, None
+
+    if not result:
+        return None, None
+    if result[0] == b'wait':
+        return float(result[1]), None
+    return None, json.loads(result[1].decode())
@@ -0,0 +1,171 @@
+import copy
+import math
+import threading
+
+from wot_app.exceptions import InvalidResourceDataException
+
+NUMERIC_TYPES = ('float', 'int')
+
+
+def field_spec(spec):
+    """
+    Normalizes a data field spec. A spec is either a type name, e.g. "float",
+    or a dict like {"type": "float", "required": true, "min": 0, "max": 100}.
+    """
+    if isinstance(spec, dict):
+        return {
+            'type': spec['type'],
+            'required': bool(spec.get('required', False)),
+            'min': spec.get('min'),
+            'max': spec.get('max'),
+        }
+    return {'type': spec, 'required': False, 'min': None, 'max': None}
+
+
+def numeric_fields(data_fields):
+    return [field for field, spec in data_fields.items() if field_spec(spec)['type'] in NUMERIC_TYPES]
+
+
+def _to_float(val):
+    val = val if type(val) is float else float(val)
+    # NaN would pass any range check, and neither it nor infinity is valid JSON
+    if not math.isfinite(val):
+        raise ValueError
+    return val
+
+
+def _to_int(val):
+    if type(val) is int:
+        return val
+    if isinstance(val, str):
+        return int(val)
+    raise TypeError
+
+
+def _exact_type(type_name):
+    def check(val):
+        if type(val).__name__ != type_name:
+            raise TypeError
+        return val
+    return check
+
+
+def _ranged(coerce, min_value, max_value):
+    def check(val):
+        val = coerce(val)
+        if (min_value is not None and val < min_value) or (max_value is not None and val > max_value):
+            raise OutOfRange
+        return val
+    return check
+
+
+class OutOfRange(ValueError):
+    pass
+
+
+class ResourceDataValidator:
+    """
+    Validator compiled from the data fields of a resource into one check
+    function per field. Validating a sample returns a copy with numeric fields
+    coerced to their declared type.
+    """
+
+    def __init__(self, data_fields):
+        self.data_fields = copy.deepcopy(data_fields)
+        self.checks = {}
+        self.required = frozenset()
+        required = []
+        for field, spec in data_fields.items():
+            spec = field_spec(spec)
+            if spec['type'] == 'float':
+                check = _to_float
+            elif spec['type'] == 'int':
+                check = _to_int
+            else:
+                check = _exact_type(spec['type'])
+
+            if spec['min'] is not None or spec['max'] is not None:
+                check = _ranged(check, spec['min'], spec['max'])
+            self.checks[field] = check
+
+            if spec['required']:
+                required.append(field)
+        self.required = frozenset(required)
+
+    def errors(self, data):
+        """
+        Returns the list of errors of an invalid sample.
+        """
+        if not isinstance(data, dict):
+            return [{'field': None, 'error': 'not_an_object'}]
+
+        errors = []
+        for field, val in data.items():
+            check = self.checks.get(field)
+            if check is None:
+                errors.append({'field': field, 'error': 'unknown_field'})
+                continue
+
+            try:
+                check(val)
+            except OutOfRange:
+                errors.append({'field': field, 'error': 'out_of_range'})
+            except (TypeError, ValueError):
+                errors.append({'field': field, 'error': 'invalid_type'})
+
+        for field in self.required.difference(data):
+            errors.append({'field': field, 'error': 'missing'})
+        return errors
+
+    def _coerce(self, data):
+        # Fast path for valid samples; errors are only detailed on failure
+        checks = self.checks
+        coerced = {field: checks[field](val) for field, val in data.items()}
+        if self.required and not self.required.issubset(coerced):
+            raise KeyError
+        return coerced
+
+    def validate(self, data):
+        try:
+            return self._coerce(data)
+        except Exception:
+            raise InvalidResourceDataException(self.errors(data))
+
+    def validate_batch(self, samples):
+        """
+        Validates all the samples, reporting the errors of every invalid one
+        with its index in the batch.
+        """
+        coerce = self._coerce
+        try:
+            return [coerce(data) for data in samples]
+        except Exception:
+            pass
+
+        errors = []
+        for index, data in enumerate(samples):
+            try:
+                coerce(data)
+            except Exception:
+                errors.extend(dict(error, index=index) for error in self.errors(data))
+        raise InvalidResourceDataException(errors)
+
+
+_validators = {}
+_validators_lock = threading.Lock()
+
+
+def get_validator(resource):
+    """
+    Returns the compiled validator of the resource, recompiling it when the
+    data fields of the resource have changed.
+    """
+    cached = _validators.get(resource.id)
+    if cached is not None and cached.data_fields == resource.data_fields:
+        return cached
+
+    validator = ResourceDataValidator(resource.data_fields)
+    if resource.id is not None:
+        with _validators_lock:
+            _validators[resource.id] = validator
+    return validator
@@ -0,0 +1,150 @@
+"""
+Write-behind of resource data.
+
+With WOT_WRITE_BEHIND enabled, accepted samples are not inserted by the
+request that posts them. They are appended to a durable queue on the local
+disk and inserted into the database by the flusher (run_write_behind command)
+in group commits, once WOT_WRITE_BEHIND_MAX_BATCH samples are queued or the
+oldest of them has waited WOT_WRITE_BEHIND_MAX_DELAY seconds. Events are
+evaluated for every flushed batch, as for any batch write.
+
+Acknowledgement contract of the write endpoints in this mode:
+
+- 400 is returned as usual for invalid data, nothing is queued then.
+- 202 means that the samples are valid and are committed to the queue with
+  an fsync, so they survive a crash or restart of the host processes.
+- Samples are readable and trigger their events once flushed, normally
+  within WOT_WRITE_BEHIND_MAX_DELAY seconds. Their time is the time they
+  were queued at, as if they had been inserted then.
+- Delivery to the database is at-least-once: a flusher that dies between
+  the insert and the removal from the queue inserts that batch again.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from wot_app.ingest import write_resource_data_batch
+from wot_app.models import Resource
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    return getattr(settings, 'WOT_WRITE_BEHIND', False)
+
+
+class WriteBehindQueue:
+    """
+    Append-only queue of samples in a SQLite database in WAL mode, shared by
+    the processes of the host. Every append is a synchronous commit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.execute('CREATE TABLE IF NOT EXISTS samples ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                               'resource_id INTEGER NOT NULL, '
+                               'data TEXT NOT NULL, '
+                               'received REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def put(self, samples_by_resource):
+        """
+        Appends the samples of the resources in one transaction. Returns once
+        they are on disk.
+        """
+        received = time.time()
+        rows = [(resource.id, json.dumps(data, cls=DjangoJSONEncoder), received)
+                for resource, samples in samples_by_resource.items() for data in samples]
+        with self.connection:
+            self.connection.executemany('INSERT INTO samples (resource_id, data, received) VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def peek(self, limit):
+        return self.connection.execute(
+            'SELECT id, resource_id, data, received FROM samples ORDER BY id LIMIT ?', (limit,)).fetchall()
+
+    def backlog(self):
+        """
+        Returns the number of queued samples and the age of the oldest one in
+        seconds. Ids are consecutive and only the oldest samples are removed,
+        so the count is the span of the ids, read from the primary key without
+        counting the rows.
+        """
+        row = self.connection.execute(
+            'SELECT id, received, (SELECT MAX(id) FROM samples) FROM samples ORDER BY id LIMIT 1').fetchone()
+        if row is None:
+            return 0, 0
+        first_id, oldest, last_id = row
+        return last_id - first_id + 1, time.time() - oldest
+
+    def remove(self, last_id):
+        with self.connection:
+            self.connection.execute('DELETE FROM samples WHERE id <= ?', (last_id,))
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        _queue = WriteBehindQueue(settings.WOT_WRITE_BEHIND_QUEUE)
+    return _queue
+
+
+def enqueue_resource_data_batch(samples_by_resource):
+    """
+    Durably queues samples of one or more resources that have already been
+    validated. Returns the number of queued samples.
+    """
+    return get_queue().put(samples_by_resource)
+
+
+def flush_write_behind_queue(max_batch=None):
+    """
+    Inserts up to max_batch of the oldest queued samples with one insert and
+    removes them from the queue. Samples of deleted resources are dropped.
+    Returns the number of samples taken from the queue.
+    """
+    queue = get_queue()
+    rows = queue.peek(max_batch or getattr(settings, 'WOT_WRITE_BEHIND_MAX_BATCH', 5000))
+    if not rows:
+        return 0
+
+    resources = Resource.objects.select_related('application').in_bulk({row[1] for row in rows})
+    samples_by_resource = {}
+    created_by_resource = {}
+    dropped = 0
+    for _, resource_id, data, received in rows:
+        resource = resources.get(resource_id)
+        if resource is None:
+            dropped += 1
+            continue
+        samples_by_resource.setdefault(resource, []).append(json.loads(data))
+        created_by_resource.setdefault(resource, []).append(datetime.fromtimestamp(received, timezone.utc))
+
+    if dropped:
+        logger.warning('Dropped %s queued samples of deleted resources', dropped)
+    if samples_by_resource:
+        write_resource_data_batch(samples_by_resource, validate=False, created_by_resource=created_by_resource)
+
+    queue.remove(rows[-1][0])
+    return len(rows)